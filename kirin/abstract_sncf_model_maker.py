@@ -32,9 +32,8 @@ from __future__ import absolute_import, print_function, unicode_literals, divisi
 import logging
 from datetime import timedelta
 
-import jmespath
-
-from kirin.utils import record_internal_failure, to_navitia_utc_str
+from kirin import app
+from kirin.utils import record_internal_failure, to_navitia_utc_str, call_concurrently
 from kirin.exceptions import ObjectNotFound, InvalidArguments, InternalException
 from abc import ABCMeta
 import six
@@ -89,15 +88,37 @@ def headsigns(str_headsign):
     return [signs[0], alternative_headsign]
 
 
-def get_navitia_stop_time_sncf(cr, ci, ch, nav_vj):
+def make_navitia_stop_times_sncf_index(nav_vj):
+    """
+    Index the stop_times of a navitia vehicle journey by CR-CI-CH code of their stop_area
+    :return: dict CR-CI-CH code -> list of stop_times (in the order of the vj)
+    """
+    index = {}
+    for nav_st in nav_vj.get("stop_times", []):
+        codes = nav_st.get("stop_point", {}).get("stop_area", {}).get("codes", [])
+        for code in {c.get("value") for c in codes if c.get("type") == "CR-CI-CH"}:
+            index.setdefault(code, []).append(nav_st)
+    return index
+
+
+def get_navitia_stop_time_sncf(cr, ci, ch, nav_stop_times_index):
+    """
+    :param nav_stop_times_index: stop_times of the navitia vehicle journey indexed by CR-CI-CH code
+        (see make_navitia_stop_times_sncf_index())
+
+    >>> st = {'stop_point': {'id': 'sp:1', 'stop_area': {'codes': [{'type': 'CR-CI-CH', 'value': '87-1-BV'}]}}}
+    >>> index = make_navitia_stop_times_sncf_index({'stop_times': [st]})
+    >>> get_navitia_stop_time_sncf('87', '1', 'BV', index)[0]['stop_point']['id']
+    u'sp:1'
+    >>> get_navitia_stop_time_sncf('87', '2', 'BV', index)[1]['log']
+    u'missing stop point'
+    >>> index = make_navitia_stop_times_sncf_index({'stop_times': [st, st]})
+    >>> get_navitia_stop_time_sncf('87', '1', 'BV', index)[1]['log']
+    u'duplicate stops'
+    """
     nav_external_code = "{cr}-{ci}-{ch}".format(cr=cr, ci=ci, ch=ch)
 
-    nav_stop_times = jmespath.search(
-        "stop_times[? stop_point.stop_area.codes[? value==`{nav_ext_code}` && type==`CR-CI-CH`]]".format(
-            nav_ext_code=nav_external_code
-        ),
-        nav_vj,
-    )
+    nav_stop_times = nav_stop_times_index.get(nav_external_code)
 
     log_dict = None
     if not nav_stop_times:
@@ -114,6 +135,108 @@ class AbstractSNCFKirinModelBuilder(six.with_metaclass(ABCMeta, object)):
     def __init__(self, nav, contributor):
         self.navitia = nav
         self.contributor = contributor
+        self._instance_data_pub_date = None
+        self.navitia_responses = {}  # responses of navitia requests made, by (request name, arguments)
+        self.navitia_stop_times_indexes = {}  # stop_times of navitia vehicle journeys by CR-CI-CH code, by vj id
+
+    def __repr__(self):
+        """ Allow this class to be cacheable (cache is invalidated when navitia data is published)
+        """
+        return "{}.{}.{}".format(self.__class__, self.navitia.url, self.instance_data_pub_date)
+
+    @property
+    def instance_data_pub_date(self):
+        """
+        Publication date of navitia data, requested on first need
+        """
+        if self._instance_data_pub_date is None:
+            self._instance_data_pub_date = self.navitia.get_publication_date()
+        return self._instance_data_pub_date
+
+    def _prefetch_navitia_requests(self, requests):
+        """
+        Make concurrently (see call_concurrently()) the navitia requests that will be needed,
+        so that _request_navitia() then uses their responses
+        :param requests: list of (request method, tuple of arguments)
+        """
+        requests = [(r, args) for r, args in requests if (r.__name__, args) not in self._responses_of(r)]
+        responses = call_concurrently(lambda request, args: request(*args), requests)
+        for (r, args), resp in responses.items():
+            self._responses_of(r)[(r.__name__, args)] = resp
+
+    def _get_navitia_stop_time_sncf(self, cr, ci, ch, nav_vj):
+        """
+        Get the stop_time of the navitia vehicle journey at the stop_area with the external code cr-ci-ch
+        """
+        nav_stop_times_index = self.navitia_stop_times_indexes.get(nav_vj.get("id"))
+        if nav_stop_times_index is None:
+            nav_stop_times_index = make_navitia_stop_times_sncf_index(nav_vj)
+        return get_navitia_stop_time_sncf(cr, ci, ch, nav_stop_times_index)
+
+    def _request_navitia(self, request, *args):
+        """
+        Make given navitia request, unless it was already made
+        """
+        key = (request.__name__, args)
+        responses = self._responses_of(request)
+        if key not in responses:
+            responses[key] = request(*args)
+        return responses[key]
+
+    def _responses_of(self, request):
+        """
+        :return: the dict where the responses of given navitia request are kept
+        """
+        return self.navitia_responses
+
+    def _navitia_vjs_requests(self, headsign_str, since_dt, until_dt):
+        """
+        List the navitia requests made by _get_navitia_vjs() with the same parameters
+        """
+        if (since_dt is None) or (until_dt is None):
+            return []
+        # to get the date of the vj we use the start/end of the vj + some tolerance
+        # since the SNCF data and navitia data might not be synchronized
+        extended_since_dt = since_dt - SNCF_SEARCH_MARGIN
+        extended_until_dt = until_dt + SNCF_SEARCH_MARGIN
+        return [
+            (self._request_navitia_vjs, (train_number, extended_since_dt, extended_until_dt))
+            for train_number in headsigns(headsign_str)
+        ]
+
+    # The navitia vehicle journeys of a train are searched again and again, as a train gets many messages a day.
+    # The search period is computed from the base-schedule of the train,
+    # so it's the same for all messages of a circulation of the train.
+    # They are cached (for NAVITIA_SNCF_VJ_CACHE_TIMEOUT) until navitia data is published (see __repr__())
+    def _request_navitia_vjs(self, train_number, since_dt, until_dt):
+        cache_key = self._search_navitia_vjs.make_cache_key(
+            self._search_navitia_vjs.uncached, self, train_number, since_dt, until_dt
+        )
+        navitia_vjs = app.cache.get(cache_key)
+        if navitia_vjs is None:
+            navitia_vjs = self._search_navitia_vjs.uncached(self, train_number, since_dt, until_dt)
+            app.cache.set(
+                cache_key,
+                navitia_vjs,
+                timeout=app.config.get(str("NAVITIA_SNCF_VJ_CACHE_TIMEOUT"), 24 * 60 * 60),
+            )
+        return navitia_vjs
+
+    # only memoized for its cache key, the timeout of the cache is read at each call (see _request_navitia_vjs())
+    @app.cache.memoize()
+    def _search_navitia_vjs(self, train_number, since_dt, until_dt):
+        logging.getLogger(__name__).debug(
+            "searching for vj {} during period [{} - {}] in navitia".format(train_number, since_dt, until_dt)
+        )
+        return self.navitia.vehicle_journeys(
+            q={
+                "headsign": train_number,
+                "since": to_navitia_utc_str(since_dt),
+                "until": to_navitia_utc_str(until_dt),
+                "depth": "2",  # we need this depth to get the stoptime's stop_area
+                "show_codes": "true",  # we need the stop_points CRCICH codes
+            }
+        )
 
     def _get_navitia_vjs(self, headsign_str, since_dt, until_dt, action_on_trip=ActionOnTrip.NOT_ADDED.name):
         """
@@ -125,8 +248,6 @@ class AbstractSNCFKirinModelBuilder(six.with_metaclass(ABCMeta, object)):
             Typically the supposed datetime of last base-schedule stop_time.
         :param action_on_trip: action to be performed on trip. This param is used to do consistency check
         """
-        log = logging.getLogger(__name__)
-
         if (since_dt is None) or (until_dt is None):
             return []
 
@@ -134,33 +255,15 @@ class AbstractSNCFKirinModelBuilder(six.with_metaclass(ABCMeta, object)):
             raise InternalException("Invalid datetime provided: must be naive (and UTC)")
 
         vjs = {}
-        # to get the date of the vj we use the start/end of the vj + some tolerance
-        # since the SNCF data and navitia data might not be synchronized
-        extended_since_dt = since_dt - SNCF_SEARCH_MARGIN
-        extended_until_dt = until_dt + SNCF_SEARCH_MARGIN
+        requests = self._navitia_vjs_requests(headsign_str, since_dt, until_dt)
+        self._prefetch_navitia_requests(requests)
 
-        # using a set to deduplicate
         # one headsign_str (ex: "96320/1") can lead to multiple headsigns (ex: ["96320", "96321"])
         # but most of the time (if not always) they refer to the same VJ
         # (the VJ switches headsign along the way).
         # So we do one VJ search for each headsign to ensure we get it, then deduplicate VJs
-        for train_number in headsigns(headsign_str):
-
-            log.debug(
-                "searching for vj {} during period [{} - {}] in navitia".format(
-                    train_number, extended_since_dt, extended_until_dt
-                )
-            )
-
-            navitia_vjs = self.navitia.vehicle_journeys(
-                q={
-                    "headsign": train_number,
-                    "since": to_navitia_utc_str(extended_since_dt),
-                    "until": to_navitia_utc_str(extended_until_dt),
-                    "depth": "2",  # we need this depth to get the stoptime's stop_area
-                    "show_codes": "true",  # we need the stop_points CRCICH codes
-                }
-            )
+        for request, (train_number, extended_since_dt, extended_until_dt) in requests:
+            navitia_vjs = self._request_navitia(request, train_number, extended_since_dt, extended_until_dt)
 
             # Consistency check on action applied to trip
             if action_on_trip == ActionOnTrip.NOT_ADDED.name:
@@ -185,6 +288,7 @@ class AbstractSNCFKirinModelBuilder(six.with_metaclass(ABCMeta, object)):
                 try:
                     vj = model.VehicleJourney(nav_vj, extended_since_dt, extended_until_dt, vj_start_dt=since_dt)
                     vjs[nav_vj["id"]] = vj
+                    self.navitia_stop_times_indexes[nav_vj["id"]] = make_navitia_stop_times_sncf_index(nav_vj)
                 except Exception as e:
                     logging.getLogger(__name__).exception(
                         "Error while creating kirin VJ of {}: {}".format(nav_vj.get("id"), e)
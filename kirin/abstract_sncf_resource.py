@@ -57,8 +57,6 @@ class AbstractSNCFResource(Resource):
         try:
             # create a raw rt_update obj, save the raw_input into the db
             rt_update = make_rt_update(input_raw, contributor_type, contributor=self.contributor)
-            # assuming UTF-8 encoding for all input
-            rt_update.raw_data = rt_update.raw_data.encode("utf-8")
 
             # raw_input is interpreted
             trip_updates = self.builder(self.navitia_wrapper, self.contributor).build(rt_update)
@@ -1,6 +1,6 @@
 # coding=utf-8
-#
-# Copyright (c) 2001-2018, Canal TP and/or its affiliates. All rights reserved.
+
+# Copyright (c) 2001-2015, Canal TP and/or its affiliates. All rights reserved.
 #
 # This file is part of Navitia,
 #     the software to build cool stuff with public transport.
@@ -29,17 +29,17 @@
 # https://groups.google.com/d/forum/navitia
 # www.navitia.io
 
-from __future__ import absolute_import, print_function, unicode_literals, division
-from tests.mock_navitia import navitia_response
 
-response = navitia_response.NavitiaResponse()
+from __future__ import absolute_import, print_function, unicode_literals, division
+from kirin import manager
 
-response.queries = ['companies/?filter=company.has_code("RefProd", "1180")&count=1']
 
-response.response_code = 200
+@manager.command
+def poll_gtfs_rt():
+    """
+    Launch the concurrent poller of GTFS-RT contributors (to be used with KIRIN_USE_GEVENT and
+    KIRIN_GTFS_RT_CONCURRENT_POLLER set)
+    """
+    from kirin.gtfs_rt import poller
 
-response.json_response = """
-{
-"companies": []
-}
-"""
+    poller.run()
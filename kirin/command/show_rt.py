@@ -1,6 +1,6 @@
 # coding=utf-8
-#
-# Copyright (c) 2001-2018, Canal TP and/or its affiliates. All rights reserved.
+
+# Copyright (c) 2001-2015, Canal TP and/or its affiliates. All rights reserved.
 #
 # This file is part of Navitia,
 #     the software to build cool stuff with public transport.
@@ -30,35 +30,30 @@
 # www.navitia.io
 
 from __future__ import absolute_import, print_function, unicode_literals, division
-from tests.mock_navitia import navitia_response
-
-response = navitia_response.NavitiaResponse()
+from kirin import manager
+from kirin.core.model import RealTimeUpdate
+from kirin.core.types import ConnectorType
+from google.protobuf.message import DecodeError
+import logging
 
-response.queries = ['companies/?filter=company.has_code("RefProd", "1187")&count=1']
 
-response.response_code = 200
+@manager.command
+def show_rt_update(rt_update_id):
+    """
+    print the raw data of a real_time_update (GTFS-RT protobuf is rendered as text)
+    """
+    rtu = RealTimeUpdate.query.get(rt_update_id)
+    if not rtu:
+        logging.getLogger(__name__).info("real_time_update %s not found", rt_update_id)
+        return
+    raw_data = rtu.raw_data
+    if rtu.connector == ConnectorType.gtfs_rt.value and raw_data:
+        from kirin import gtfs_realtime_pb2
 
-response.json_response = """
-{
-"companies": [
-    {
-        "codes": [
-            {
-                "type": "RefProd",
-                "value": "1187"
-            },
-            {
-                "type": "external_code",
-                "value": "OCESN"
-            },
-            {
-                "type": "source",
-                "value": "SN"
-            }
-        ],
-        "id": "company:OCE:SN",
-        "name": "SNCF CRS"
-    }
-  ]
-}
-"""
+        proto = gtfs_realtime_pb2.FeedMessage()
+        try:
+            proto.ParseFromString(raw_data)
+            raw_data = proto
+        except DecodeError:
+            pass  # invalid protobuf (or saved as text before), printed as is
+    print(raw_data)
@@ -157,14 +157,17 @@ def manage_consistency(trip_update):
     return True
 
 
-def find_st_in_vj(st_id, vj_sts):
+def make_vj_st_index(vj_sts):
     """
-    Find a stop_time in the navitia vehicle journey
-    :param st_id: id of the requested stop_time
+    Index the stop_times of a navitia vehicle journey by stop_point id, to find a stop_time in it
+    (the first stop_time is kept for a stop_point served multiple times)
     :param vj_sts: list of stop_times available in the vj
-    :return: stop_time if found else None
+    :return: dict stop_point id -> stop_time
     """
-    return next((vj_st for vj_st in vj_sts if vj_st.get("stop_point", {}).get("id") == st_id), None)
+    index = {}
+    for vj_st in vj_sts:
+        index.setdefault(vj_st.get("stop_point", {}).get("id"), vj_st)
+    return index
 
 
 def handle(real_time_update, trip_updates, contributor, is_new_complete=False):
@@ -176,18 +179,14 @@ def handle(real_time_update, trip_updates, contributor, is_new_complete=False):
     if not real_time_update:
         raise TypeError()
     id_timestamp_tuples = [(tu.vj.navitia_trip_id, tu.vj.start_timestamp) for tu in trip_updates]
-    old_trip_updates = TripUpdate.find_by_dated_vjs(id_timestamp_tuples)
+    old_trip_updates = {
+        (tu.vj.navitia_trip_id, tu.vj.start_timestamp): tu
+        for tu in TripUpdate.find_by_dated_vjs(id_timestamp_tuples)
+    }
+    merged_trip_updates = []
     for trip_update in trip_updates:
         # find if there is already a row in db
-        old = next(
-            (
-                tu
-                for tu in old_trip_updates
-                if tu.vj.navitia_trip_id == trip_update.vj.navitia_trip_id
-                and tu.vj.start_timestamp == trip_update.vj.start_timestamp
-            ),
-            None,
-        )
+        old = old_trip_updates.get((trip_update.vj.navitia_trip_id, trip_update.vj.start_timestamp))
         # merge the base schedule, the current realtime, and the new realtime
         current_trip_update = merge(trip_update.vj.navitia_vj, old, trip_update, is_new_complete=is_new_complete)
 
@@ -195,11 +194,31 @@ def handle(real_time_update, trip_updates, contributor, is_new_complete=False):
         if current_trip_update and manage_consistency(current_trip_update):
             # we have to link the current_vj_update with the new real_time_update
             # this link is done quite late to avoid too soon persistence of trip_update by sqlalchemy
+            # (appending doesn't load the previous real_time_updates of the trip_update)
             current_trip_update.real_time_updates.append(real_time_update)
+            merged_trip_updates.append(current_trip_update)
+
+    # After merging trip_updates information of connector realtime, navitia and kirin database, if there is no
+    # new information destined to navitia, update real_time_update with status = 'KO' and a proper error message.
+    no_new_information_msg = None
+    if not merged_trip_updates and real_time_update.status == "OK":
+        no_new_information_msg = "No new information destined to navitia for this {}".format(
+            real_time_update.connector
+        )
+        set_rtu_status_ko(real_time_update, no_new_information_msg, is_reprocess_same_data_allowed=False)
 
+    # The feed is built from the merged objects in memory, before the commit:
+    # commit expires all objects, that would be reloaded from db to build the feed.
+    # A flush is needed beforehand to get the ids of newly created objects.
+    model.db.session.add(real_time_update)
+    model.db.session.flush()
+    if no_new_information_msg:
+        logging.getLogger(__name__).warning(
+            "RealTimeUpdate id={}: {}".format(real_time_update.id, no_new_information_msg)
+        )
+    feed = convert_to_gtfsrt(merged_trip_updates)
     persist(real_time_update)
 
-    feed = convert_to_gtfsrt(real_time_update.trip_updates)
     feed_str = feed.SerializeToString()
     publish(feed_str, contributor)
 
@@ -210,14 +229,6 @@ def handle(real_time_update, trip_updates, contributor, is_new_complete=False):
         "trip_update_count": len(feed.entity),
         "size": len(feed_str),
     }
-    # After merging trip_updates information of connector realtime, navitia and kirin database, if there is no new
-    # information destined to navitia, update real_time_update with status = 'KO' and a proper error message.
-    if not real_time_update.trip_updates and real_time_update.status == "OK":
-        msg = "No new information destined to navitia for this {}".format(real_time_update.connector)
-        set_rtu_status_ko(real_time_update, msg, is_reprocess_same_data_allowed=False)
-        logging.getLogger(__name__).warning("RealTimeUpdate id={}: {}".format(real_time_update.id, msg))
-        model.db.session.add(real_time_update)
-        model.db.session.commit()
 
     return real_time_update, log_dict
 
@@ -308,7 +319,7 @@ def is_stop_event_served(event_name, stop_id, stop_order, nav_stop, db_tu, new_s
     :param stop_order: order of the stop_time in the trip
     Different RT information available:
     :param nav_stop: Navitia stop point
-    :param db_tu: TripUpdate in db (from previous processing)
+    :param db_tu: TripUpdate in db (from previous processing), or its StopTimeUpdateIndex
     :param new_stu: new StopTimeUpdate being process
     """
     # the new_stu prevails if provided
@@ -339,7 +350,7 @@ def is_new_stop_event_valid(event_name, stop_id, stop_order, nav_stop, db_tu, ne
     :param stop_order: order of the stop_time in the trip
     Different RT information available:
     :param nav_stop: Navitia stop point
-    :param db_tu: TripUpdate in db (from previous processing)
+    :param db_tu: TripUpdate in db (from previous processing), or its StopTimeUpdateIndex
     :param new_stu: new StopTimeUpdate being process
     """
     # None is not considered valid (not worth iterating)
@@ -391,6 +402,7 @@ def make_fake_realtime_stop_time(order, sp_id, new_stu, db_trip_update):
     Since the wanted stop_point doesn't exist in the base vj (for example, we want to delay/delete a stop_point
     which is added by a previous disruption), we search the wanted stop_point in db first, if we cannot find it
     in the db(for example, the very first 'add'), we use the info of new_stu
+    db_trip_update can be the TripUpdate in db or its StopTimeUpdateIndex
     """
     stu = db_trip_update.find_stop(sp_id, order) if db_trip_update else None
     if stu and not new_stu.departure and not new_stu.arrival:  # new_stu datetime prevails
@@ -411,6 +423,34 @@ def make_fake_realtime_stop_time(order, sp_id, new_stu, db_trip_update):
     }
 
 
+def reuse_db_stop_time_updates(db_stop_time_updates, new_stop_time_updates):
+    """
+    Replace the new StopTimeUpdates by the ones already in db for the same stop (same stop_id and same
+    occurrence of this stop_id in the trip, for lollipops), with their values updated.
+    This way only changed stop_times are UPDATEd in db, stop_times are INSERTed or DELETEd only if
+    the list of stops changes (instead of DELETEing and INSERTing every stop_time of the trip).
+    :return: list of StopTimeUpdates to be set in the TripUpdate
+    """
+
+    def occurrence_keys(stop_time_updates):
+        nb_occurrences = {}
+        for stu in stop_time_updates:
+            occurrence = nb_occurrences.get(stu.stop_id, 0)
+            nb_occurrences[stu.stop_id] = occurrence + 1
+            yield (stu.stop_id, occurrence), stu
+
+    db_stus = dict(occurrence_keys(db_stop_time_updates))
+    res = []
+    for key, new_stu in occurrence_keys(new_stop_time_updates):
+        db_stu = db_stus.get(key)
+        if db_stu is None or db_stu is new_stu:
+            res.append(new_stu)
+        else:
+            db_stu.update_with(new_stu)
+            res.append(db_stu)
+    return res
+
+
 def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
     """
     We need to merge the info from 3 sources:
@@ -461,12 +501,18 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
         res.stop_time_updates = []
         return res
 
+    # stops are searched multiple times for each stop of the trip, so they are indexed once for the merge
+    # (stop_time_updates lists are not modified before the end of the merge)
+    db_stops = db_trip_update.make_stop_index() if db_trip_update else None
+    new_stops = new_trip_update.make_stop_index()
+
     def get_next_stop():
         if is_new_complete:
+            vj_sts = make_vj_st_index(new_trip_update.vj.navitia_vj.get("stop_times", []))
             # Iterate on the new trip update stop_times if it is complete (all stop_times present in it)
             for order, new_stu in enumerate(new_trip_update.stop_time_updates):
                 # Find corresponding stop_time in the theoretical VJ
-                vj_st = find_st_in_vj(new_stu.stop_id, new_trip_update.vj.navitia_vj.get("stop_times", []))
+                vj_st = vj_sts.get(new_stu.stop_id)
                 if vj_st:
                     yield order, vj_st
                 else:
@@ -477,20 +523,20 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
                         stop_id=sp_id,
                         stop_order=order,
                         nav_stop=None,
-                        db_tu=db_trip_update,
+                        db_tu=db_stops,
                         new_stu=new_stu,
                     ) or is_new_stop_event_valid(
                         event_name="departure",
                         stop_id=sp_id,
                         stop_order=order,
                         nav_stop=None,
-                        db_tu=db_trip_update,
+                        db_tu=db_stops,
                         new_stu=new_stu,
                     ):
                         # It is an added stop_time or a modification on a previously added stop_time, create a
                         # new "fake" Navitia stop time (even if it's not in navitia,
                         #  kirin needs to iterate on it)
-                        yield order, make_fake_realtime_stop_time(order, sp_id, new_stu, db_trip_update)
+                        yield order, make_fake_realtime_stop_time(order, sp_id, new_stu, db_stops)
         else:
             # Iterate on the theoretical VJ if the new trip update doesn't list all stop_times
             for order, vj_st in enumerate(navitia_vj.get("stop_times", [])):
@@ -528,7 +574,7 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
         # consideration
         base_arrival = base_departure = None
         stop_id = navitia_stop.get("stop_point", {}).get("id")
-        new_st = new_trip_update.find_stop(stop_id, nav_order)
+        new_st = new_stops.find_stop(stop_id, nav_order)
 
         # considering only served arrival
         if is_stop_event_served(
@@ -536,7 +582,7 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
             stop_id=stop_id,
             stop_order=nav_order,
             nav_stop=navitia_stop,
-            db_tu=db_trip_update,
+            db_tu=db_stops,
             new_stu=new_st,
         ):
             arrival_delay = (
@@ -560,7 +606,7 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
             stop_id=stop_id,
             stop_order=nav_order,
             nav_stop=navitia_stop,
-            db_tu=db_trip_update,
+            db_tu=db_stops,
             new_stu=new_st,
         ):
             departure_delay = (
@@ -583,7 +629,7 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
             Then      : we should probably update it or not if the input info is exactly the same as the
                         one in db.
             """
-            db_st = db_trip_update.find_stop(stop_id, nav_order)
+            db_st = db_stops.find_stop(stop_id, nav_order)
             new_st_update = _make_stop_time_update(
                 base_arrival, base_departure, last_departure, new_st, navitia_stop["stop_point"], order=nav_order
             )
@@ -610,7 +656,7 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
 
                         *** Here, we MUST NOT do anything, only update stop time's order ***
             """
-            db_st = db_trip_update.find_stop(stop_id, nav_order)
+            db_st = db_stops.find_stop(stop_id, nav_order)
             res_st = (
                 db_st
                 if db_st is not None
@@ -639,7 +685,9 @@ def merge(navitia_vj, db_trip_update, new_trip_update, is_new_complete=False):
     res.effect = new_trip_update.effect
 
     if has_changes:
-        res.stop_time_updates = res_stoptime_updates
+        res.stop_time_updates = reuse_db_stop_time_updates(
+            db_trip_update.stop_time_updates if db_trip_update else [], res_stoptime_updates
+        )
         return res
 
     return None
@@ -32,11 +32,19 @@
 from __future__ import absolute_import, print_function, unicode_literals, division
 from datetime import timedelta
 from sqlalchemy.dialects import postgresql
-from sqlalchemy.orm import backref, deferred
+from sqlalchemy.orm import backref, deferred, foreign
 from sqlalchemy.ext.orderinglist import ordering_list
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+import calendar
 import datetime
+import hashlib
+import itertools
+import logging
+import re
+import six
 import sqlalchemy
+import zlib
 from sqlalchemy import desc
 from kirin.core.types import ModificationType, TripEffect, ConnectorType
 from kirin.exceptions import ObjectNotFound, InternalException
@@ -72,6 +80,49 @@ def gen_uuid():
     return str(uuid.uuid4())
 
 
+def to_timestamp(naive_utc_dt):
+    if naive_utc_dt is None:
+        return None
+    return calendar.timegm(naive_utc_dt.utctimetuple())
+
+
+def from_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+def to_seconds(delay):
+    if delay is None:
+        return None
+    return int(delay.total_seconds())
+
+
+def from_seconds(seconds):
+    if seconds is None:
+        return None
+    return datetime.timedelta(seconds=seconds)
+
+
+def find_daily_partitions(table_name):
+    """
+    :return: list of (day, partition table name) of the daily partitions '<table_name>_YYYYMMDD'
+        of a table, ordered by day
+    """
+    name_re = re.compile(r"^{}_(\d{{8}})$".format(table_name))
+    rows = db.session.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        "    WHERE i.inhparent = CAST(:table_name AS REGCLASS)",
+        {"table_name": table_name},
+    )
+    partitions = []
+    for (name,) in rows:
+        match = name_re.match(name)
+        if match:
+            partitions.append((datetime.datetime.strptime(match.group(1), "%Y%m%d").date(), name))
+    return sorted(partitions)
+
+
 class TimestampMixin(object):
     created_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime(), default=None, onupdate=datetime.datetime.utcnow)
@@ -85,6 +136,10 @@ Db_ConnectorType = db.Enum(*[c.value for c in ConnectorType], name="connector_ty
 class VehicleJourney(db.Model):  # type: ignore
     """
     Base-schedule Vehicle Journey on a given day (navitia VJ + UTC datetime of first stop)
+
+    In db, vehicle_journey, trip_update and stop_time_update rows are stored in daily partitions
+    '<table>_YYYYMMDD' (by day of start_timestamp) inheriting from their table, created on insert by a trigger
+    (see migration 5b7d3e9f1a26). Foreign keys are only enforced between partitions of a same day.
     """
 
     id = db.Column(postgresql.UUID, default=gen_uuid, primary_key=True)
@@ -169,9 +224,8 @@ class StopTimeUpdate(db.Model, TimestampMixin):  # type: ignore
     """
 
     id = db.Column(postgresql.UUID, default=gen_uuid, primary_key=True)
-    trip_update_id = db.Column(
-        postgresql.UUID, db.ForeignKey("trip_update.vj_id", ondelete="CASCADE"), nullable=False
-    )
+    # no foreign key on trip_update: its rows live in daily partitions (see VehicleJourney)
+    trip_update_id = db.Column(postgresql.UUID, nullable=False)
     db.Index("trip_update_id_idx", trip_update_id)
 
     # stop time's order in the vj
@@ -250,6 +304,57 @@ class StopTimeUpdate(db.Model, TimestampMixin):  # type: ignore
             or self.arrival_status != other.arrival_status
         )
 
+    def to_compact(self):
+        """
+        Json-compatible form of the stop_time, stored in TripUpdate.compact_stop_time_updates
+        (datetimes are UTC POSIX timestamps and delays are seconds)
+        """
+        return {
+            "stop_id": self.stop_id,
+            "order": self.order,
+            "message": self.message,
+            "departure": to_timestamp(self.departure),
+            "departure_delay": to_seconds(self.departure_delay),
+            "departure_status": self.departure_status,
+            "arrival": to_timestamp(self.arrival),
+            "arrival_delay": to_seconds(self.arrival_delay),
+            "arrival_status": self.arrival_status,
+        }
+
+    @classmethod
+    def from_compact(cls, compact_stu):
+        return cls(
+            {"id": compact_stu["stop_id"]},
+            departure=from_timestamp(compact_stu["departure"]),
+            arrival=from_timestamp(compact_stu["arrival"]),
+            departure_delay=from_seconds(compact_stu["departure_delay"]),
+            arrival_delay=from_seconds(compact_stu["arrival_delay"]),
+            dep_status=compact_stu["departure_status"],
+            arr_status=compact_stu["arrival_status"],
+            message=compact_stu["message"],
+            order=compact_stu["order"],
+        )
+
+    def update_with(self, other):
+        """
+        Set values of other (the ones compared in is_not_equal) in self.
+        Only changed values are set, so that only those are updated in db
+        """
+        for attr in (
+            "stop_id",
+            "message",
+            "order",
+            "departure",
+            "departure_delay",
+            "departure_status",
+            "arrival",
+            "arrival_delay",
+            "arrival_status",
+        ):
+            value = getattr(other, attr)
+            if getattr(self, attr) != value:
+                setattr(self, attr, value)
+
     def get_stop_event_status(self, event_name):
         if not hasattr(self, "{}_status".format(event_name)):
             raise Exception('StopTimeUpdate has no attribute "{}_status"'.format(event_name))
@@ -267,11 +372,15 @@ class StopTimeUpdate(db.Model, TimestampMixin):  # type: ignore
 associate_realtimeupdate_tripupdate = db.Table(
     "associate_realtimeupdate_tripupdate",
     db.metadata,
-    db.Column("real_time_update_id", postgresql.UUID, db.ForeignKey("real_time_update.id", ondelete="CASCADE")),
-    db.Column("trip_update_id", postgresql.UUID, db.ForeignKey("trip_update.vj_id", ondelete="CASCADE")),
+    # no foreign key on real_time_update: its rows live in daily partitions (see RealTimeUpdate)
+    db.Column("real_time_update_id", postgresql.UUID),
+    # nor on trip_update (partitioned too, see VehicleJourney), rows are removed with their TripUpdate by
+    # TripUpdate.remove_by_contributors_and_period()
+    db.Column("trip_update_id", postgresql.UUID),
     db.PrimaryKeyConstraint(
         "real_time_update_id", "trip_update_id", name="associate_realtimeupdate_tripupdate_pkey"
     ),
+    db.Index("associate_realtimeupdate_tripupdate_trip_update_id_idx", "trip_update_id"),
 )
 
 
@@ -282,16 +391,13 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
     (result of all received RT feeds on base trip)
     """
 
-    vj_id = db.Column(
-        postgresql.UUID,
-        db.ForeignKey("vehicle_journey.id", ondelete="CASCADE"),
-        nullable=False,
-        primary_key=True,
-    )
+    # no foreign key on vehicle_journey: its rows live in daily partitions (see VehicleJourney)
+    vj_id = db.Column(postgresql.UUID, nullable=False, primary_key=True)
     db.Index("vj_id_idx", vj_id)
     status = db.Column(Db_ModificationType, nullable=False, default="none")
     vj = db.relationship(
         "VehicleJourney",
+        primaryjoin="VehicleJourney.id == foreign(TripUpdate.vj_id)",
         uselist=False,
         lazy="joined",
         backref=backref("trip_update", cascade="all, delete-orphan", single_parent=True),
@@ -299,14 +405,18 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
         single_parent=True,
     )
     message = db.Column(db.Text, nullable=True)
-    stop_time_updates = db.relationship(
+    # stop_times are stored either as rows of table stop_time_update,
+    # or in compact_stop_time_updates (then no row is used), see stop_time_updates property
+    stop_time_update_rows = db.relationship(
         "StopTimeUpdate",
+        primaryjoin="TripUpdate.vj_id == foreign(StopTimeUpdate.trip_update_id)",
         backref="trip_update",
         lazy="joined",
         order_by="StopTimeUpdate.order",
         collection_class=ordering_list("order"),
         cascade="all, delete-orphan",
     )
+    compact_stop_time_updates = db.Column(postgresql.JSONB, nullable=True)
     company_id = db.Column(db.Text, nullable=True)
     effect = db.Column(Db_TripEffect, nullable=True)
     physical_mode_id = db.Column(db.Text, nullable=True)
@@ -325,14 +435,61 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
         self.physical_mode_id = physical_mode_id
         self.headsign = headsign
         self.contributor_id = contributor
+        # the storage of stop_times is chosen once for all when the TripUpdate is created
+        if current_app.config.get(str("USE_COMPACT_STOP_TIME_UPDATES"), False):
+            self.compact_stop_time_updates = []
 
     def __repr__(self):
         return "<TripUpdate %r>" % self.vj_id
 
+    @property
+    def stop_time_updates(self):
+        """
+        List of StopTimeUpdate of the trip, ordered and numbered by "order" (whatever their storage).
+        For a compact storage, the list is deserialized on first access and serialized back in
+        compact_stop_time_updates at each flush if it changed (see save_compact_stop_time_updates())
+        """
+        if self.compact_stop_time_updates is None:
+            return self.stop_time_update_rows
+        if "_compact_stus" not in self.__dict__:
+            self._set_compact_stus(
+                (StopTimeUpdate.from_compact(c) for c in self.compact_stop_time_updates),
+                saved=self.compact_stop_time_updates,
+            )
+        return self._compact_stus
+
+    @stop_time_updates.setter
+    def stop_time_updates(self, stop_time_updates):
+        if self.compact_stop_time_updates is None:
+            self.stop_time_update_rows = stop_time_updates
+        else:
+            self.__dict__.setdefault("_saved_compact_stus", self.compact_stop_time_updates)
+            self._set_compact_stus(stop_time_updates, saved=self._saved_compact_stus)
+
+    def _set_compact_stus(self, stop_time_updates, saved):
+        self._compact_stus = ordering_list("order")()
+        for stu in stop_time_updates:
+            self._compact_stus.append(stu)
+        # last value stored, to write compact_stop_time_updates only if it changes
+        self._saved_compact_stus = saved
+
+    def save_compact_stop_time_updates(self):
+        """
+        Serialize stop_times in compact_stop_time_updates, if they are stored in this compact form
+        and if they were accessed (thus possibly modified)
+        """
+        compact_stus = self.__dict__.get("_compact_stus")
+        if compact_stus is None:
+            return
+        compact = [stu.to_compact() for stu in compact_stus]
+        if compact != self._saved_compact_stus:
+            self.compact_stop_time_updates = compact
+            self._saved_compact_stus = compact
+
     @classmethod
     def find_by_dated_vj(cls, navitia_trip_id, start_timestamp):
         return (
-            cls.query.join(VehicleJourney)
+            cls.query.join(cls.vj)
             .filter(
                 VehicleJourney.navitia_trip_id == navitia_trip_id,
                 VehicleJourney.start_timestamp == start_timestamp,
@@ -343,7 +500,7 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
     @classmethod
     def find_vj_by_period(cls, navitia_trip_id, start_date, end_date):
         return (
-            cls.query.join(VehicleJourney)
+            cls.query.join(cls.vj)
             .filter(
                 VehicleJourney.navitia_trip_id == navitia_trip_id,
                 VehicleJourney.start_timestamp >= start_date,
@@ -354,13 +511,42 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
 
     @classmethod
     def find_by_dated_vjs(cls, id_timestamp_tuples):
-        from sqlalchemy import tuple_
+        """
+        Find TripUpdates of all given dated VJs (list of tuples (navitia_trip_id, start_timestamp))
+
+        Dated VJs are provided to postgres as 2 arrays unnested in a relation that is joined with vehicle_journey
+        (a huge "IN" list of tuples is hard to plan on big feeds)
+        """
+        if not id_timestamp_tuples:
+            return []
+        trip_ids, start_timestamps = zip(*set(id_timestamp_tuples))
+        dated_vjs = (
+            sqlalchemy.text(
+                "SELECT * FROM unnest(CAST(:trip_ids AS TEXT[]), CAST(:start_timestamps AS TIMESTAMP[])) "
+                "AS dated_vj(navitia_trip_id, start_timestamp)"
+            )
+            .bindparams(
+                sqlalchemy.bindparam("trip_ids", value=list(trip_ids), type_=postgresql.ARRAY(db.Text)),
+                sqlalchemy.bindparam(
+                    "start_timestamps", value=list(start_timestamps), type_=postgresql.ARRAY(db.DateTime)
+                ),
+            )
+            .columns(navitia_trip_id=db.Text, start_timestamp=db.DateTime)
+            .alias("dated_vj")
+        )
 
         return (
-            cls.query.join(VehicleJourney)
-            .filter(
-                tuple_(VehicleJourney.navitia_trip_id, VehicleJourney.start_timestamp).in_(id_timestamp_tuples)
+            cls.query.join(cls.vj)
+            .join(
+                dated_vjs,
+                sqlalchemy.and_(
+                    VehicleJourney.navitia_trip_id == dated_vjs.c.navitia_trip_id,
+                    VehicleJourney.start_timestamp == dated_vjs.c.start_timestamp,
+                ),
             )
+            # explicit bounds let postgres only scan the vehicle_journey partitions of the days concerned
+            # (trip_update partitions have no CHECK constraint, they are only looked up by vj_id index)
+            .filter(VehicleJourney.start_timestamp.between(min(start_timestamps), max(start_timestamps)))
             .order_by(VehicleJourney.navitia_trip_id)
             .all()
         )
@@ -381,16 +567,111 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
         return query.all()
 
     @classmethod
-    def remove_by_contributors_and_period(cls, contributors, start_date=None, end_date=None):
-        trip_updates_to_remove = cls.find_by_contributor_period(
-            contributors=contributors, start_date=start_date, end_date=end_date
+    def remove_by_contributors_and_period(
+        cls, contributors, start_date=None, end_date=None, batch_size=1000, time_budget=None
+    ):
+        """
+        Remove TripUpdates (and their VehicleJourneys, StopTimeUpdates and links to RealTimeUpdates)
+        of given contributors whose VJ starts in the period.
+
+        Days of the period where all TripUpdates are removed are dropped as a whole (see
+        drop_partitions_by_contributors_and_period()).
+        The rest of the removal is done in db (links to RealTimeUpdates and VehicleJourneys are deleted,
+        the rest is removed by "ON DELETE CASCADE"), by batches of VehicleJourneys in start_timestamp order,
+        each batch being committed on its own to keep transactions short.
+        :param batch_size: max number of VehicleJourneys removed by batch
+        :param time_budget: max duration (in seconds) of the removal, remaining TripUpdates are kept
+            (for next removal) once reached. No limit if None
+        :return: number of VehicleJourneys removed
+        """
+        logger = logging.getLogger(__name__)
+        start_time = datetime.datetime.utcnow()
+        vj_query = (
+            db.session.query(VehicleJourney.id)
+            .join(cls, cls.vj_id == VehicleJourney.id)
+            .filter(cls.contributor_id.in_(contributors))
         )
-        for t in trip_updates_to_remove:
-            f = sqlalchemy.text("associate_realtimeupdate_tripupdate.trip_update_id='{}'".format(t.vj_id))
-            db.session.query(associate_realtimeupdate_tripupdate).filter(f).delete(synchronize_session=False)
-            db.session.delete(t)
+        if start_date:
+            start_dt = datetime.datetime.combine(start_date, datetime.time(0, 0))
+            vj_query = vj_query.filter(VehicleJourney.start_timestamp >= start_dt)
+        if end_date:
+            end_dt = datetime.datetime.combine(end_date, datetime.time(0, 0)) + datetime.timedelta(days=1)
+            vj_query = vj_query.filter(VehicleJourney.start_timestamp <= end_dt)
+        vj_query = vj_query.order_by(VehicleJourney.start_timestamp).limit(batch_size)
+
+        nb_removed = cls.drop_partitions_by_contributors_and_period(contributors, start_date, end_date)
+        while True:
+            vj_ids = [vj_id for (vj_id,) in vj_query.all()]
+            if vj_ids:
+                db.session.execute(
+                    associate_realtimeupdate_tripupdate.delete().where(
+                        associate_realtimeupdate_tripupdate.c.trip_update_id.in_(vj_ids)
+                    )
+                )
+                VehicleJourney.query.filter(VehicleJourney.id.in_(vj_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            nb_batch_removed = len(vj_ids)
+            nb_removed += nb_batch_removed
+            logger.info(
+                "%s trip_updates removed for %s (%s in this batch)", nb_removed, contributors, nb_batch_removed
+            )
+            if nb_batch_removed < batch_size:
+                break
+            elapsed = (datetime.datetime.utcnow() - start_time).total_seconds()
+            if time_budget is not None and elapsed > time_budget:
+                logger.warning(
+                    "time budget of %ss exceeded while removing trip_updates for %s, "
+                    "remaining ones are kept for the next removal",
+                    time_budget,
+                    contributors,
+                )
+                break
 
-        db.session.commit()
+        return nb_removed
+
+    @classmethod
+    def drop_partitions_by_contributors_and_period(cls, contributors, start_date=None, end_date=None):
+        """
+        Drop the daily partitions of vehicle_journey, trip_update and stop_time_update (and the links of their
+        TripUpdates to RealTimeUpdates) of the days of the period where every VehicleJourney has a TripUpdate
+        of given contributors.
+        Each day is committed on its own.
+        :return: number of VehicleJourneys removed
+        """
+        logger = logging.getLogger(__name__)
+        nb_removed = 0
+        for day, vj_partition in find_daily_partitions(VehicleJourney.__tablename__):
+            if start_date and day < start_date:
+                continue
+            if end_date and day > end_date:
+                break
+            suffix = day.strftime("%Y%m%d")
+            tu_partition = "{}_{}".format(cls.__tablename__, suffix)
+            stu_partition = "{}_{}".format(StopTimeUpdate.__tablename__, suffix)
+            # no row can be inserted in the partitions between the check and the drop
+            db.session.execute(
+                "LOCK TABLE {}, {}, {} IN ACCESS EXCLUSIVE MODE".format(
+                    vj_partition, tu_partition, stu_partition
+                )
+            )
+            nb_vj, nb_kept = db.session.execute(
+                "SELECT count(*), count(*) FILTER (WHERE tu.vj_id IS NULL"
+                "    OR NOT (tu.contributor_id = ANY(:contributors)))"
+                "    FROM {} vj LEFT JOIN {} tu ON tu.vj_id = vj.id".format(vj_partition, tu_partition),
+                {"contributors": list(contributors)},
+            ).first()
+            if nb_kept:
+                db.session.commit()  # releases the lock
+                continue
+            db.session.execute(
+                "DELETE FROM associate_realtimeupdate_tripupdate"
+                "    WHERE trip_update_id IN (SELECT vj_id FROM {})".format(tu_partition)
+            )
+            db.session.execute("DROP TABLE {}, {}, {}".format(stu_partition, tu_partition, vj_partition))
+            db.session.commit()
+            nb_removed += nb_vj
+            logger.info("partitions of %s dropped: %s trip_updates removed for %s", day, nb_vj, contributors)
+        return nb_removed
 
     def find_stop(self, stop_id, order=None):
         # To handle a vj with the same stop served multiple times (lollipop) we search first with
@@ -403,6 +684,144 @@ class TripUpdate(db.Model, TimestampMixin):  # type: ignore
             return first
         return next((st for st in self.stop_time_updates if st.stop_id == stop_id), None)
 
+    def make_stop_index(self):
+        """
+        Index the current stop_time_updates to search them repeatedly (see StopTimeUpdateIndex)
+        """
+        return StopTimeUpdateIndex(self.stop_time_updates)
+
+
+class StopTimeUpdateIndex(object):
+    """
+    Snapshot of a list of StopTimeUpdate indexed by (stop_id, order) and by stop_id only.
+    Its find_stop() gives the same result as TripUpdate.find_stop(), but in constant time.
+
+    The index is not updated when the list is modified: it must be used while the list is not modified
+    (typically during the merge of a TripUpdate).
+    """
+
+    def __init__(self, stop_time_updates):
+        self._by_stop_and_order = {}
+        self._by_stop = {}
+        for st in stop_time_updates:
+            # only the first occurrence is kept, as the linear search would find it first
+            self._by_stop_and_order.setdefault((st.stop_id, st.order), st)
+            self._by_stop.setdefault(st.stop_id, st)
+
+    def find_stop(self, stop_id, order=None):
+        first = self._by_stop_and_order.get((stop_id, order))
+        if first:
+            return first
+        return self._by_stop.get(stop_id)
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, "before_flush")
+def save_compact_stop_time_updates(session, flush_context, instances):
+    # TripUpdates whose compact stop_times were accessed are not flagged dirty (they may only be read),
+    # they are dirty once compact_stop_time_updates is written, if the stop_times changed
+    deleted = session.deleted
+    for obj in itertools.chain(session.new, session.identity_map.values()):
+        if isinstance(obj, TripUpdate) and obj not in deleted:
+            obj.save_compact_stop_time_updates()
+
+
+@sqlalchemy.event.listens_for(TripUpdate, "expire")
+def reset_compact_stop_time_updates(target, attrs):
+    """
+    Forget deserialized compact stop_times when compact_stop_time_updates is expired (or refreshed),
+    so that they are read again from the db
+    """
+    if attrs is None or "compact_stop_time_updates" in attrs:
+        target.__dict__.pop("_compact_stus", None)
+        target.__dict__.pop("_saved_compact_stus", None)
+
+
+@sqlalchemy.event.listens_for(TripUpdate, "refresh")
+def reset_refreshed_compact_stop_time_updates(target, context, attrs):
+    reset_compact_stop_time_updates(target, attrs)
+
+
+class RawData(db.Model):  # type: ignore
+    """
+    Raw input of RealTimeUpdates, zlib-compressed and identified by the sha256 of its (uncompressed) content,
+    so that RealTimeUpdates with the same input share it
+    created_at is the last time a RealTimeUpdate was saved with this input (see purge)
+    """
+
+    hash = db.Column(db.Text, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, nullable=False)
+    db.Index("raw_data_created_at_idx", created_at)
+
+    @staticmethod
+    def make_hash(raw_data):
+        """
+        :return: digest of a raw input (text is UTF-8 encoded), to compare inputs without loading them
+
+        >>> RawData.make_hash("toto") == RawData.make_hash(b"toto")
+        True
+        """
+        if isinstance(raw_data, six.text_type):
+            raw_data = raw_data.encode("utf-8")
+        return hashlib.sha256(raw_data).hexdigest()
+
+    @classmethod
+    def save(cls, raw_hash, raw_data):
+        """
+        Store raw_data (bytes) in db if no RawData with the same hash exists yet.
+        Otherwise the RawData is marked as used now (created_at is refreshed), for the purge not to remove it
+        before the RealTimeUpdate using it is committed.
+        """
+        now = datetime.datetime.utcnow()
+        connection = db.session.connection()
+        nb_reused = connection.execute(
+            sqlalchemy.text("UPDATE raw_data SET created_at = :now WHERE hash = :hash"),
+            {"hash": raw_hash, "now": now},
+        ).rowcount
+        if nb_reused:
+            return
+        # in a savepoint, as RealTimeUpdates of same content can be saved concurrently
+        savepoint = connection.begin_nested()
+        try:
+            connection.execute(
+                sqlalchemy.text(
+                    "INSERT INTO raw_data (hash, data, created_at) VALUES (:hash, :data, :now)"
+                ).bindparams(sqlalchemy.bindparam("data", type_=db.LargeBinary)),
+                {"hash": raw_hash, "data": zlib.compress(raw_data), "now": now},
+            )
+            savepoint.commit()
+        except sqlalchemy.exc.IntegrityError:
+            # saved by a concurrent transaction (with a created_at just as recent)
+            savepoint.rollback()
+
+    @classmethod
+    def load(cls, raw_hash):
+        """
+        :return: the raw data (bytes) of the given hash, None if not found
+        """
+        row = db.session.query(cls.data).filter(cls.hash == raw_hash).first()
+        return zlib.decompress(row.data) if row else None
+
+    @classmethod
+    def remove_unused_until(cls, until):
+        """
+        Remove RawData last used until a date that are not used by any RealTimeUpdate anymore
+        """
+        db.session.execute(
+            "DELETE FROM raw_data rd WHERE rd.created_at <= :until"
+            "    AND NOT EXISTS (SELECT 1 FROM real_time_update rtu WHERE rtu.raw_data_hash = rd.hash)",
+            {"until": until},
+        )
+        db.session.commit()
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, "before_flush")
+def save_raw_data(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in itertools.chain(session.new, session.dirty):
+            if isinstance(obj, RealTimeUpdate):
+                obj.save_raw_data()
+
 
 class RealTimeUpdate(db.Model, TimestampMixin):  # type: ignore
     """
@@ -413,6 +832,9 @@ class RealTimeUpdate(db.Model, TimestampMixin):  # type: ignore
     constructed real_time_update's id should be affected to TripUpdate's real_time_update_id
 
     There is a one-to-many relationship between RealTimeUpdate and TripUpdate.
+
+    In db, rows are stored in daily partitions 'real_time_update_YYYYMMDD' (by created_at) inheriting from
+    table real_time_update, created on insert by a trigger (see migration 4a5e1c2b9d07).
     """
 
     id = db.Column(postgresql.UUID, default=gen_uuid, primary_key=True)
@@ -421,15 +843,23 @@ class RealTimeUpdate(db.Model, TimestampMixin):  # type: ignore
     status = db.Column(db.Enum("OK", "KO", "pending", name="rt_status"), nullable=False)
     db.Index("status_idx", status)
     error = db.Column(db.Text, nullable=True)
-    raw_data = deferred(db.Column(db.Text, nullable=True))
+    # raw input is stored in RawData (see raw_data property), column raw_data was emptied when moved to RawData
+    # (it's only kept for the downgrade of the migration)
+    legacy_raw_data = deferred(db.Column("raw_data", db.Text, nullable=True))
+    raw_data_hash = db.Column(db.Text, nullable=True)
+    db.Index("realtime_update_raw_data_hash_idx", raw_data_hash)
     contributor_id = db.Column(db.Text, db.ForeignKey("contributor.id"), nullable=False)
 
+    # TripUpdate.real_time_updates is "dynamic": the whole history of RealTimeUpdates of a trip is never loaded
+    # when a new one is appended (only the association row is inserted), it's read through an explicit query
     trip_updates = db.relationship(
         "TripUpdate",
         secondary=associate_realtimeupdate_tripupdate,
+        primaryjoin=id == foreign(associate_realtimeupdate_tripupdate.c.real_time_update_id),
+        secondaryjoin=TripUpdate.vj_id == foreign(associate_realtimeupdate_tripupdate.c.trip_update_id),
         cascade="all",
         lazy="select",
-        backref=backref("real_time_updates", cascade="all"),
+        backref=backref("real_time_updates", cascade="all", lazy="dynamic"),
     )
 
     __table_args__ = (
@@ -446,6 +876,40 @@ class RealTimeUpdate(db.Model, TimestampMixin):  # type: ignore
         self.received_at = received_at if received_at else datetime.datetime.utcnow()
         self.contributor_id = contributor
 
+    @property
+    def raw_data(self):
+        """
+        Raw input (bytes) of the RealTimeUpdate, loaded from RawData on first access
+        """
+        if getattr(self, "_raw_data", None) is None:
+            if self.raw_data_hash:
+                self._raw_data = RawData.load(self.raw_data_hash)
+        return getattr(self, "_raw_data", None)
+
+    @raw_data.setter
+    def raw_data(self, raw_data):
+        if isinstance(raw_data, six.text_type):
+            # assuming UTF-8 encoding for all input
+            raw_data = raw_data.encode("utf-8")
+        self._raw_data = raw_data
+        self._raw_data_saved = False
+        self.raw_data_hash = RawData.make_hash(raw_data) if raw_data is not None else None
+
+    def has_raw_data(self, raw_data):
+        """
+        Check if given raw input is the one of the RealTimeUpdate (comparing digests, the input is not loaded)
+        """
+        return self.raw_data_hash is not None and self.raw_data_hash == RawData.make_hash(raw_data)
+
+    def save_raw_data(self):
+        """
+        Store the raw input set since last flush (done before each flush)
+        """
+        if getattr(self, "_raw_data_saved", True) or self._raw_data is None:
+            return
+        RawData.save(self.raw_data_hash, self._raw_data)
+        self._raw_data_saved = True
+
     @classmethod
     def get_probes_by_contributor(cls):
         """
@@ -497,11 +961,59 @@ class RealTimeUpdate(db.Model, TimestampMixin):  # type: ignore
 
         return result
 
+    @classmethod
+    def find_partitions(cls):
+        """
+        :return: list of (day, partition table name) of real_time_update, ordered by day
+        """
+        return find_daily_partitions(cls.__tablename__)
+
+    @classmethod
+    def drop_partitions_by_connectors_until(cls, connectors, until):
+        """
+        Drop the daily partitions of real_time_update whose rows would all be removed by
+        remove_by_connectors_until(connectors, until): no row created after 'until', of another connector,
+        or still linked to a TripUpdate.
+        Each drop is committed on its own.
+        :return: number of partitions dropped
+        """
+        logger = logging.getLogger(__name__)
+        nb_dropped = 0
+        for day, partition in cls.find_partitions():
+            if day >= until:
+                break
+            # rows of the partition can't be read (to be linked to a TripUpdate) between the check and the drop
+            db.session.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(partition))
+            is_kept = db.session.execute(
+                "SELECT EXISTS (SELECT 1 FROM {} rtu WHERE rtu.created_at > :until"
+                "    OR NOT (rtu.connector::TEXT = ANY(:connectors))"
+                "    OR EXISTS (SELECT 1 FROM associate_realtimeupdate_tripupdate art"
+                "               WHERE art.real_time_update_id = rtu.id))".format(partition),
+                {"until": until, "connectors": list(connectors)},
+            ).scalar()
+            if is_kept:
+                db.session.commit()  # releases the lock
+                continue
+            db.session.execute("DROP TABLE {}".format(partition))
+            db.session.commit()
+            nb_dropped += 1
+            logger.info("partition %s of real_time_update dropped", partition)
+        return nb_dropped
+
     @classmethod
     def remove_by_connectors_until(cls, connectors, until):
+        """
+        Remove RealTimeUpdates of given connectors created until a date, that are not linked to any TripUpdate.
+
+        Whole daily partitions are dropped when possible, remaining rows are deleted.
+        """
+        cls.drop_partitions_by_connectors_until(connectors, until)
         sub_query = (
             db.session.query(cls.id)
-            .outerjoin(associate_realtimeupdate_tripupdate)
+            .outerjoin(
+                associate_realtimeupdate_tripupdate,
+                cls.id == associate_realtimeupdate_tripupdate.c.real_time_update_id,
+            )
             .filter(cls.connector.in_(connectors))
             .filter(cls.created_at <= until)
             .filter(associate_realtimeupdate_tripupdate.c.real_time_update_id == None)
@@ -509,6 +1021,7 @@ class RealTimeUpdate(db.Model, TimestampMixin):  # type: ignore
         cls.query.filter(cls.id.in_(sub_query)).delete(synchronize_session=False)
 
         db.session.commit()
+        RawData.remove_unused_until(until)
 
     @classmethod
     def get_last_rtu(cls, connector, contributor):
@@ -521,6 +1034,8 @@ class Contributor(db.Model):  # type: ignore
     """
     Contributor models a feeder for a specific coverage.
     Its ID refers to its Kraken's name (eg. 'realtime.bla')
+    For polled feeds, min/max_polling_interval bound the (adaptive) interval between 2 pollings, in seconds
+    (app's configuration is used when not provided).
     """
 
     id = db.Column(db.Text, nullable=False, primary_key=True)
@@ -529,14 +1044,28 @@ class Contributor(db.Model):  # type: ignore
     feed_url = db.Column(db.Text, nullable=True)
     connector_type = db.Column(Db_ConnectorType, nullable=False)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
+    min_polling_interval = db.Column(db.Integer, nullable=True)
+    max_polling_interval = db.Column(db.Integer, nullable=True)
 
-    def __init__(self, id, navitia_coverage, connector_type, navitia_token=None, feed_url=None, is_active=True):
+    def __init__(
+        self,
+        id,
+        navitia_coverage,
+        connector_type,
+        navitia_token=None,
+        feed_url=None,
+        is_active=True,
+        min_polling_interval=None,
+        max_polling_interval=None,
+    ):
         self.id = id
         self.navitia_coverage = navitia_coverage
         self.connector_type = connector_type
         self.navitia_token = navitia_token
         self.feed_url = feed_url
         self.is_active = is_active
+        self.min_polling_interval = min_polling_interval
+        self.max_polling_interval = max_polling_interval
 
     @classmethod
     def find_by_connector_type(cls, type):
@@ -545,3 +1074,40 @@ class Contributor(db.Model):  # type: ignore
     @classmethod
     def query_existing(cls):
         return cls.query.filter_by(is_active=True)
+
+
+class EntityFingerprint(db.Model, TimestampMixin):  # type: ignore
+    """
+    Fingerprint of the last processed content of an entity of a contributor's feed (GTFS-RT),
+    used to skip entities that did not change since last feed
+    """
+
+    contributor_id = db.Column(
+        db.Text, db.ForeignKey("contributor.id", ondelete="CASCADE"), nullable=False, primary_key=True
+    )
+    entity_key = db.Column(db.Text, nullable=False, primary_key=True)
+    fingerprint = db.Column(db.Text, nullable=False)
+
+    def __init__(self, contributor, entity_key, fingerprint):
+        self.contributor_id = contributor
+        self.entity_key = entity_key
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def find_by_contributor(cls, contributor):
+        """
+        :return: dict of EntityFingerprints of the contributor by entity_key
+        """
+        return {f.entity_key: f for f in cls.query.filter_by(contributor_id=contributor)}
+
+    @classmethod
+    def remove_by_contributor_until(cls, contributor, until):
+        """
+        Remove fingerprints of entities not seen (with a new content) since given date
+        """
+        last_seen = sqlalchemy.func.coalesce(cls.updated_at, cls.created_at)
+        nb_removed = cls.query.filter(cls.contributor_id == contributor, last_seen <= until).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return nb_removed
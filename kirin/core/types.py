@@ -106,8 +106,7 @@ def get_effect_by_stop_time_status(status):
     return status_to_effect.get(status, TripEffect.UNKNOWN_EFFECT.name)
 
 
-def get_mode_filter(indicator=None):
-    return {
-        "FERRE": "physical_mode.id=physical_mode:LongDistanceTrain",
-        "ROUTIER": "physical_mode.id=physical_mode:Coach",
-    }.get(indicator, "physical_mode.id=physical_mode:LongDistanceTrain")
+def get_mode_id(indicator=None):
+    return {"FERRE": "physical_mode:LongDistanceTrain", "ROUTIER": "physical_mode:Coach"}.get(
+        indicator, "physical_mode:LongDistanceTrain"
+    )
@@ -35,6 +35,7 @@ from flask.globals import current_app
 import navitia_wrapper
 import logging
 
+from kirin import redis_client
 from kirin.abstract_sncf_resource import AbstractSNCFResource
 from kirin.cots import KirinModelBuilder
 from kirin.exceptions import InvalidArguments, SubServiceError
@@ -85,7 +86,11 @@ class Cots(AbstractSNCFResource):
         contributor = get_cots_contributor()
         super(Cots, self).__init__(
             navitia_wrapper.Navitia(
-                url=current_app.config[str("NAVITIA_URL")], token=contributor.navitia_token
+                url=current_app.config[str("NAVITIA_URL")],
+                token=contributor.navitia_token,
+                cache=redis_client,
+                query_timeout=current_app.config.get(str("NAVITIA_QUERY_CACHE_TIMEOUT"), 600),
+                pubdate_timeout=current_app.config.get(str("NAVITIA_PUBDATE_CACHE_TIMEOUT"), 600),
             ).instance(contributor.navitia_coverage),
             current_app.config.get(str("NAVITIA_TIMEOUT"), 5),
             contributor.id,
@@ -35,6 +35,7 @@ import requests as requests
 import six
 
 from kirin import app
+from kirin.http_sessions import get_session
 
 from kirin.exceptions import ObjectNotFound, UnauthorizedOnSubService, SubServiceError
 
@@ -119,7 +120,9 @@ class MessageHandler:
         headers = {"X-API-Key": self.api_key}
         data = {"client_id": self.client_id, "client_secret": self.client_secret, "grant_type": self.grant_type}
 
-        response = self._service_caller(method=requests.post, url=self.token_server, headers=headers, data=data)
+        response = self._service_caller(
+            method=get_session(self.token_server).post, url=self.token_server, headers=headers, data=data
+        )
         if not response:
             return None
         content = response.json()
@@ -134,7 +137,9 @@ class MessageHandler:
         if access_token is None:
             raise SubServiceError("Impossible to get a token for COTS cause message sub-service")
         headers = {"X-API-Key": self.api_key, "Authorization": "Bearer {}".format(access_token)}
-        resp = self._service_caller(method=requests.get, url=self.resource_server, headers=headers)
+        resp = self._service_caller(
+            method=get_session(self.resource_server).get, url=self.resource_server, headers=headers
+        )
         messages = {}
         if not resp:
             return messages
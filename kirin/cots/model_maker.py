@@ -31,17 +31,18 @@
 
 from __future__ import absolute_import, print_function, unicode_literals, division
 
+import itertools
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from operator import itemgetter
 
 from dateutil import parser
 from flask.globals import current_app
 from pytz import utc
+import six
 
 from kirin.abstract_sncf_model_maker import (
     AbstractSNCFKirinModelBuilder,
-    get_navitia_stop_time_sncf,
     TRAIN_ID_FORMAT,
     SNCF_SEARCH_MARGIN,
     TripStatus,
@@ -53,6 +54,7 @@ from kirin.abstract_sncf_model_maker import (
 import ujson
 
 from kirin.core import model
+from kirin.cots import referential
 from kirin.cots.message_handler import MessageHandler
 from kirin.exceptions import InvalidArguments
 from kirin.utils import record_internal_failure
@@ -61,10 +63,16 @@ from kirin.core.types import (
     ModificationType,
     get_higher_status,
     get_effect_by_stop_time_status,
-    get_mode_filter,
+    get_mode_id,
 )
 
 DEFAULT_COMPANY_ID = "1187"
+PARSED_DATETIMES_MAX_SIZE = 100000
+_parsed_datetimes = {}  # naive UTC datetimes by COTS timestamp
+# navitia requests of referential objects (see referential module)
+REFERENTIAL_REQUESTS = {"_request_navitia_stop_point"}
+# number of objects of a collection listed by page (companies, physical modes)
+REFERENTIAL_COLLECTION_COUNT = "1000"
 
 
 def get_value(sub_json, key, nullable=False):
@@ -102,20 +110,28 @@ def _retrieve_interesting_pdp(list_pdp):
     Notes:  - written in a yield-fashion to switch implementation if possible, but we need random access for now
             - see 'test_retrieve_interesting_pdp' for a functional example
     """
+    sorted_list_pdp = sorted(list_pdp, key=itemgetter("rang"))
+    stations = [is_station(pdp) for pdp in sorted_list_pdp]
+    # has_following_arrival[idx]: a station of sorted_list_pdp[idx:] has an arrival time
+    has_following_arrival = [False] * (len(sorted_list_pdp) + 1)
+    for idx in range(len(sorted_list_pdp) - 1, -1, -1):
+        has_following_arrival[idx] = has_following_arrival[idx + 1] or bool(
+            stations[idx] and get_value(sorted_list_pdp[idx], "horaireVoyageurArrivee", nullable=True)
+        )
+
     res = []
     picked_one = False
-    sorted_list_pdp = sorted(list_pdp, key=itemgetter("rang"))
     for idx, pdp in enumerate(sorted_list_pdp):
+        departure = get_value(pdp, "horaireVoyageurDepart", nullable=True)
+        arrival = get_value(pdp, "horaireVoyageurArrivee", nullable=True)
         # At start, do not consume until there's a departure time (horaireVoyageurDepart)
-        if not picked_one and not get_value(pdp, "horaireVoyageurDepart", nullable=True):
+        if not picked_one and not departure:
             continue
         # exclude stop_times that are not legit stations
-        if not is_station(pdp):
+        if not stations[idx]:
             continue
         # exclude stop_times that have no departure nor arrival time (empty stop_times)
-        if not get_value(pdp, "horaireVoyageurDepart", nullable=True) and not get_value(
-            pdp, "horaireVoyageurArrivee", nullable=True
-        ):
+        if not departure and not arrival:
             continue
         # stop consuming once all following stop_times are missing arrival time
         # * if a stop_time only has departure time, travelers can only hop in, but if they are be able to
@@ -124,20 +140,48 @@ def _retrieve_interesting_pdp(list_pdp):
         # * if no stop_time has arrival time anymore, then stop_times are useless as traveler cannot
         #   hop off, so no point hopping in anymore, so we remove all the stop_times until the end
         #   (should not happen in practice).
-        if not get_value(pdp, "horaireVoyageurArrivee", nullable=True):
-            has_following_arrival = any(
-                get_value(follow_pdp, "horaireVoyageurArrivee", nullable=True) and is_station(follow_pdp)
-                for follow_pdp in sorted_list_pdp[idx:]
-            )
-            if not has_following_arrival:
-                break
+        if not arrival and not has_following_arrival[idx]:
+            break
 
         picked_one = True
         res.append(pdp)
     return res
 
 
-def as_utc_naive_dt(str_time):
+def _parse_cots_datetime(str_time):
+    """
+    Parse a timestamp with the usual COTS layout 'YYYY-MM-DDThh:mm:ss+hhmm' into a naive UTC datetime
+    :return: None if the timestamp doesn't have this layout
+    """
+    if (
+        len(str_time) != 24
+        or str_time[4] != "-"
+        or str_time[7] != "-"
+        or str_time[10] != "T"
+        or str_time[13] != ":"
+        or str_time[16] != ":"
+        or str_time[19] not in "+-"
+    ):
+        return None
+    digits = str_time[0:4] + str_time[5:7] + str_time[8:10] + str_time[11:13] + str_time[14:16] + str_time[17:19]
+    if not (digits + str_time[20:24]).isdigit():
+        return None
+    try:
+        dt = datetime(
+            int(str_time[0:4]),
+            int(str_time[5:7]),
+            int(str_time[8:10]),
+            int(str_time[11:13]),
+            int(str_time[14:16]),
+            int(str_time[17:19]),
+        )
+    except ValueError:
+        return None
+    utc_offset = timedelta(hours=int(str_time[20:22]), minutes=int(str_time[22:24]))
+    return dt - utc_offset if str_time[19] == "+" else dt + utc_offset
+
+
+def _parse_datetime(str_time):
     try:
         return (
             parser.parse(str_time, dayfirst=False, yearfirst=True, ignoretz=False)
@@ -150,6 +194,27 @@ def as_utc_naive_dt(str_time):
         )
 
 
+def as_utc_naive_dt(str_time):
+    """
+    Parse a timezoned COTS timestamp into a naive UTC datetime
+    (timestamps are parsed once, as the same timestamps come again and again in COTS messages)
+
+    >>> as_utc_naive_dt('2015-09-21T15:21:00+0200')
+    datetime.datetime(2015, 9, 21, 13, 21)
+    >>> as_utc_naive_dt('2015-09-21T23:21:00-0130')
+    datetime.datetime(2015, 9, 22, 0, 51)
+    >>> as_utc_naive_dt('2015-09-21T15:21:00+02:00')  # other layout
+    datetime.datetime(2015, 9, 21, 13, 21)
+    """
+    dt = _parsed_datetimes.get(str_time)
+    if dt is None:
+        dt = _parse_cots_datetime(str_time) or _parse_datetime(str_time)
+        if len(_parsed_datetimes) >= PARSED_DATETIMES_MAX_SIZE:
+            _parsed_datetimes.clear()
+        _parsed_datetimes[str_time] = dt
+    return dt
+
+
 def as_duration(seconds):
     """
     transform a number of seconds into a timedelta
@@ -294,6 +359,24 @@ def _get_action_on_trip(train_numbers, dict_version, pdps):
     return action_on_trip
 
 
+def _get_vj_period(pdps, action_on_trip):
+    """
+    :return: the (start, end) naive UTC datetimes to search the vehicle journey of given stop_times
+    """
+    skip_fully_added_stops = action_on_trip == ActionOnTrip.NOT_ADDED.name
+    vj_start = _get_first_stop_datetime(
+        pdps, "horaireVoyageurDepart", skip_fully_added_stops=skip_fully_added_stops
+    )
+    vj_end = _get_first_stop_datetime(
+        reversed(pdps), "horaireVoyageurArrivee", skip_fully_added_stops=skip_fully_added_stops
+    )
+    return vj_start, vj_end
+
+
+def _get_company_code(json_train):
+    return get_value(json_train, "codeCompagnieTransporteur", nullable=True) or DEFAULT_COMPANY_ID
+
+
 class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
     def __init__(self, nav, contributor):
         super(KirinModelBuilder, self).__init__(nav, contributor)
@@ -306,6 +389,35 @@ class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
             grant_type=current_app.config[str("COTS_PAR_IV_GRANT_TYPE")],
             timeout=current_app.config[str("COTS_PAR_IV_REQUEST_TIMEOUT")],
         )
+        self._referential_responses = None
+
+    @property
+    def referential(self):
+        """
+        Referential of the navitia publication, got on first need (as the publication date)
+        """
+        return self.referential_responses.referential
+
+    @property
+    def referential_responses(self):
+        if self._referential_responses is None:
+            self._referential_responses = referential.MessageResponses(
+                referential.get_referential(self), self.is_referential_response_found
+            )
+        return self._referential_responses
+
+    def _responses_of(self, request):
+        if request.__name__ in REFERENTIAL_REQUESTS:
+            return self.referential_responses
+        return super(KirinModelBuilder, self)._responses_of(request)
+
+    @staticmethod
+    def is_referential_response_found(response):
+        """
+        :param response: response of a referential navitia request (stop point and log dict)
+        """
+        nav_stop, _ = response
+        return nav_stop is not None
 
     def build(self, rt_update):
         """
@@ -334,23 +446,47 @@ class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
                 "json elt {elt}".format(elt=ujson.dumps(dict_version))
             )
 
+        # the pdps filtered and sorted are shared by all the steps below
         action_on_trip = _get_action_on_trip(train_numbers, dict_version, pdps)
-        vjs = self._get_vjs(train_numbers, pdps, action_on_trip=action_on_trip)
-        trip_updates = [self._make_trip_update(dict_version, vj, action_on_trip=action_on_trip) for vj in vjs]
+        vj_start, vj_end = _get_vj_period(pdps, action_on_trip)
+        self._prefetch_navitia_objects(
+            dict_version, train_numbers, vj_start, vj_end, action_on_trip=action_on_trip
+        )
+        vjs = self._get_navitia_vjs(train_numbers, vj_start, vj_end, action_on_trip=action_on_trip)
+        if get_value(dict_version, "statutOperationnel") != TripStatus.SUPPRIMEE.name:
+            self._prefetch_navitia_stop_points(pdps, vjs)
+        trip_updates = [
+            self._make_trip_update(dict_version, pdps, vj, action_on_trip=action_on_trip) for vj in vjs
+        ]
 
         return trip_updates
 
-    def _get_vjs(self, train_numbers, pdps, action_on_trip=ActionOnTrip.NOT_ADDED.name):
-        vj_start = _get_first_stop_datetime(
-            pdps, "horaireVoyageurDepart", skip_fully_added_stops=(action_on_trip == ActionOnTrip.NOT_ADDED.name)
-        )
-        vj_end = _get_first_stop_datetime(
-            reversed(pdps),
-            "horaireVoyageurArrivee",
-            skip_fully_added_stops=(action_on_trip == ActionOnTrip.NOT_ADDED.name),
-        )
+    def _prefetch_navitia_objects(self, json_train, train_numbers, vj_start, vj_end, action_on_trip):
+        """
+        Make concurrently the navitia requests for vehicle journeys, companies and physical modes
+        (the collections are only listed once per navitia publication)
+        """
+        requests = self._navitia_vjs_requests(train_numbers, vj_start, vj_end)
+        if self._list_navitia_companies.__name__ not in self.referential.collections:
+            requests.append((self._get_navitia_companies, ()))
+        if (
+            action_on_trip != ActionOnTrip.NOT_ADDED.name
+            and get_value(json_train, "statutOperationnel") != TripStatus.SUPPRIMEE.name
+            and self._list_navitia_physical_modes.__name__ not in self.referential.collections
+        ):
+            requests.append((self._get_navitia_physical_modes, ()))
+        self._prefetch_navitia_requests(requests)
 
-        return self._get_navitia_vjs(train_numbers, vj_start, vj_end, action_on_trip=action_on_trip)
+    def _prefetch_navitia_stop_points(self, pdps, vjs):
+        """
+        Make concurrently the navitia requests for stop points of the trip that are not in its vehicle journeys
+        """
+        requests = []
+        for pdp in pdps:
+            cr, ci, ch = get_value(pdp, "cr"), get_value(pdp, "ci"), get_value(pdp, "ch")
+            if any(self._get_navitia_stop_time_sncf(cr, ci, ch, vj.navitia_vj)[0] is None for vj in vjs):
+                requests.append((self._request_navitia_stop_point, (cr, ci, ch)))
+        self._prefetch_navitia_requests(requests)
 
     def _record_and_log(self, logger, log_str):
         log_dict = {"log": log_str}
@@ -373,17 +509,17 @@ class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
         if not (projected_departure >= projected_arrival >= last_stop_time_depart):
             raise InvalidArguments("invalid cots: stop_point's({}) time is not consistent".format(pdp_code))
 
-    def _make_trip_update(self, json_train, vj, action_on_trip=ActionOnTrip.NOT_ADDED.name):
+    def _make_trip_update(self, json_train, pdps, vj, action_on_trip=ActionOnTrip.NOT_ADDED.name):
         """
         create the new TripUpdate object
+        :param pdps: interesting "Points de Parcours" of the train (see _retrieve_interesting_pdp())
         Following the COTS spec: https://github.com/CanalTP/kirin/blob/master/documentation/cots_connector.md
         """
         trip_update = model.TripUpdate(vj=vj, contributor=self.contributor)
         trip_message_id = get_value(json_train, "idMotifInterneReference", nullable=True)
         if trip_message_id:
             trip_update.message = self.message_handler.get_message(index=trip_message_id)
-        cots_company_id = get_value(json_train, "codeCompagnieTransporteur", nullable=True) or DEFAULT_COMPANY_ID
-        trip_update.company_id = self._get_navitia_company(cots_company_id)
+        trip_update.company_id = self._get_navitia_company(_get_company_code(json_train))
 
         trip_status = get_value(json_train, "statutOperationnel")
 
@@ -412,7 +548,6 @@ class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
 
         # Initialize stop_time status to nochange
         highest_st_status = ModificationType.none.name
-        pdps = _retrieve_interesting_pdp(get_value(json_train, "listePointDeParcours"))
 
         # this variable is used to memoize the last stop_time's departure in order to check the stop_time consistency
         # ex. stop_time[i].arrival/departure must be greater than stop_time[i-1].departure
@@ -546,12 +681,15 @@ class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
 
         Error messages are also returned as 'missing stop point', 'duplicate stops'
         """
-        nav_st, log_dict = get_navitia_stop_time_sncf(
+        nav_st, log_dict = self._get_navitia_stop_time_sncf(
             cr=get_value(pdp, "cr"), ci=get_value(pdp, "ci"), ch=get_value(pdp, "ch"), nav_vj=nav_vj
         )
         if not nav_st:
-            nav_stop, log_dict = self._request_navitia_stop_point(
-                cr=get_value(pdp, "cr"), ci=get_value(pdp, "ci"), ch=get_value(pdp, "ch")
+            nav_stop, log_dict = self._request_navitia(
+                self._request_navitia_stop_point,
+                get_value(pdp, "cr"),
+                get_value(pdp, "ci"),
+                get_value(pdp, "ch"),
             )
         else:
             nav_stop = nav_st.get("stop_point", None)
@@ -570,29 +708,57 @@ class KirinModelBuilder(AbstractSNCFKirinModelBuilder):
     def _get_navitia_company(self, code):
         """
         Get a navitia company for the code present in COTS
-        If the company doesn't exist in navitia, another request is made to
-        find company for key="RefProd" and value="1187"
+        If the company doesn't exist in navitia, the company with key="RefProd" and value="1187" is used
         """
-        return self._request_navitia_company(code) or self._request_navitia_company(DEFAULT_COMPANY_ID)
+        companies = self._get_navitia_companies()
+        return companies.get(code) or companies.get(DEFAULT_COMPANY_ID)
 
-    def _request_navitia_company(self, code):
-        companies = self.navitia.companies(
-            q={"filter": 'company.has_code("RefProd", "{}")'.format(code), "count": "1"}
-        )
-        if companies:
-            return companies[0].get("id", None)
-        return None
+    def _get_navitia_companies(self):
+        return self.referential.get_collection(self._list_navitia_companies)
+
+    def _list_navitia_companies(self):
+        """
+        :return: dict RefProd code -> id of the navitia company
+        """
+        companies = {}
+        for company in self._list_navitia_collection("companies"):
+            for code in company.get("codes", []):
+                if code.get("type") == "RefProd":
+                    companies.setdefault(code.get("value"), company.get("id"))
+        return companies
 
     def _get_navitia_physical_mode(self, indicator=None):
         """
         Get a navitia physical_mode for the codes present in COTS ("indicateurFer" : FERRE / ROUTIER)
-        If the physical_mode doesn't exist in navitia, another request is made default physical_mode
-        with filter=physical_mode.id=physical_mode:LongDistanceTrain
+        If the physical_mode doesn't exist in navitia, the default physical_mode
+        physical_mode:LongDistanceTrain is used
         """
-        return self._request_navitia_physical_mode(indicator) or self._request_navitia_physical_mode()
-
-    def _request_navitia_physical_mode(self, indicator=None):
-        physical_modes = self.navitia.physical_modes(q={"filter": get_mode_filter(indicator), "count": "1"})
-        if physical_modes:
-            return physical_modes[0].get("id", None)
+        physical_modes = self._get_navitia_physical_modes()
+        for physical_mode in [get_mode_id(indicator), get_mode_id()]:
+            if physical_mode in physical_modes:
+                return physical_mode
         return None
+
+    def _get_navitia_physical_modes(self):
+        return self.referential.get_collection(self._list_navitia_physical_modes)
+
+    def _list_navitia_physical_modes(self):
+        """
+        :return: set of the ids of navitia physical modes
+        """
+        physical_modes = self._list_navitia_collection("physical_modes")
+        return {physical_mode.get("id") for physical_mode in physical_modes}
+
+    def _list_navitia_collection(self, collection):
+        """
+        List all the objects of a navitia collection, page by page
+        """
+        objects = []
+        for start_page in itertools.count():
+            q = {"count": REFERENTIAL_COLLECTION_COUNT}
+            if start_page:
+                q["start_page"] = six.text_type(start_page)
+            page = getattr(self.navitia, collection)(q=q)
+            objects.extend(page)
+            if len(page) < int(REFERENTIAL_COLLECTION_COUNT):
+                return objects
@@ -0,0 +1,141 @@
+# coding=utf-8
+
+# Copyright (c) 2001-2018, Canal TP and/or its affiliates. All rights reserved.
+#
+# This file is part of Navitia,
+#     the software to build cool stuff with public transport.
+#
+# Hope you'll enjoy and contribute to this project,
+#     powered by Canal TP (www.canaltp.fr).
+# Help us simplify mobility and open public transport:
+#     a non ending quest to the responsive locomotion way of traveling!
+#
+# LICENCE: This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Stay tuned using
+# twitter @navitia
+# IRC #navitia on freenode
+# https://groups.google.com/d/forum/navitia
+# www.navitia.io
+
+
+"""
+In-memory referential of the navitia objects looked up by COTS messages
+
+Companies (by RefProd code), physical modes and stop points (by CR-CI-CH code) only change when navitia data
+is published, so they are kept for all messages, in one referential per coverage and publication date:
+* companies and physical modes (small collections) are listed at once, on first need,
+* stop points are searched one by one, only the ones found are kept for all messages.
+When a new publication is detected, the collections and the stop points known in the referential of the
+previous publication are loaded again in the background, so that the new referential is warm.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals, division
+import logging
+import threading
+
+from kirin import app
+from kirin.utils import call_concurrently
+
+
+class NavitiaReferential(object):
+    def __init__(self, pub_date):
+        self.pub_date = pub_date
+        self.collections = {}  # navitia objects of the collections listed, by name of the listing request
+        # responses of referential navitia requests finding an object, by (request name, arguments)
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def get_collection(self, list_collection):
+        """
+        :param list_collection: navitia request listing the objects of the collection, made on first need
+        """
+        name = list_collection.__name__
+        if name not in self.collections:
+            with self._lock:
+                if name not in self.collections:
+                    self.collections[name] = list_collection()
+        return self.collections[name]
+
+
+class MessageResponses(dict):
+    """
+    Responses of the referential navitia requests made for a message (see AbstractSNCFKirinModelBuilder):
+    the ones finding an object are kept in the referential for all messages, the others only for the message
+    (a missing object is searched again by the next messages)
+    """
+
+    def __init__(self, referential, is_found):
+        super(MessageResponses, self).__init__()
+        self.referential = referential
+        self.is_found = is_found
+
+    def __contains__(self, key):
+        return key in self.referential.responses or dict.__contains__(self, key)
+
+    def __getitem__(self, key):
+        if key in self.referential.responses:
+            return self.referential.responses[key]
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, response):
+        if self.is_found(response):
+            self.referential.responses[key] = response
+        else:
+            dict.__setitem__(self, key, response)
+
+
+_referentials = {}  # referential of the last publication, by navitia coverage url
+_lock = threading.Lock()
+
+
+def get_referential(builder):
+    """
+    :return: the referential of the coverage and publication date of the navitia used by given model builder
+    """
+    url, pub_date = builder.navitia.url, builder.instance_data_pub_date
+    with _lock:
+        referential = _referentials.get(url)
+        if referential is not None and referential.pub_date == pub_date:
+            return referential
+        previous_referential = referential
+        referential = _referentials[url] = NavitiaReferential(pub_date)
+
+    if previous_referential is not None and (previous_referential.collections or previous_referential.responses):
+        logging.getLogger(__name__).info("new publication of %s (%s): refreshing referential", url, pub_date)
+        collection_names = list(previous_referential.collections)
+        keys = list(previous_referential.responses)
+        refresh = threading.Thread(target=_load, args=(builder, referential, collection_names, keys))
+        refresh.daemon = True
+        refresh.start()
+    return referential
+
+
+def _load(builder, referential, collection_names, keys):
+    """
+    List the given collections, make (concurrently) the referential requests of given keys,
+    and store them in the referential
+    """
+    with app.app_context():
+        try:
+            for name in collection_names:
+                referential.get_collection(getattr(builder, name))
+            responses = MessageResponses(referential, builder.is_referential_response_found)
+            for key, response in call_concurrently(
+                lambda name, args: getattr(builder, name)(*args),
+                [key for key in keys if key not in referential.responses],
+            ).items():
+                responses[key] = response
+        except Exception:
+            logging.getLogger(__name__).exception("failed to refresh referential of %s", builder.navitia.url)
@@ -19,6 +19,9 @@ NAVITIA_URL = os.getenv("KIRIN_NAVITIA_URL", None)
 
 NAVITIA_TIMEOUT = int(os.getenv("KIRIN_NAVITIA_TIMEOUT", 5))
 
+# maximum number of keep-alive connections kept by a worker to each host requested (feeds, navitia, etc.)
+HTTP_POOL_MAXSIZE = int(os.getenv("KIRIN_HTTP_POOL_MAXSIZE", 10))
+
 NAVITIA_INSTANCE = os.getenv("KIRIN_NAVITIA_INSTANCE", None)
 
 NAVITIA_TOKEN = os.getenv("KIRIN_NAVITIA_TOKEN", None)
@@ -61,10 +64,32 @@ GTFS_RT_CONTRIBUTOR = os.getenv("KIRIN_GTFS_RT_CONTRIBUTOR", None)
 GTFS_RT_FEED_URL = os.getenv("KIRIN_GTFS_RT_FEED_URL", None)
 NB_DAYS_TO_KEEP_TRIP_UPDATE = int(os.getenv("NB_DAYS_TO_KEEP_TRIP_UPDATE", 2))
 NB_DAYS_TO_KEEP_RT_UPDATE = int(os.getenv("NB_DAYS_TO_KEEP_RT_UPDATE", 10))
+# the purge of trip_updates is done by batches (of vehicle_journeys) committed one by one,
+# and stops after the time budget (in seconds), the rest being purged next time
+PURGE_TRIP_UPDATE_BATCH_SIZE = int(os.getenv("KIRIN_PURGE_TRIP_UPDATE_BATCH_SIZE", 1000))
+PURGE_TRIP_UPDATE_TIME_BUDGET = int(
+    os.getenv("KIRIN_PURGE_TRIP_UPDATE_TIME_BUDGET", timedelta(minutes=30).total_seconds())
+)
 GTFS_RT_TIMEOUT = int(os.getenv("KIRIN_GTFS_RT_TIMEOUT", 1))
+# maximum size (in bytes, once decoded) of a polled GTFS-RT feed
+GTFS_RT_MAX_FEED_SIZE = int(os.getenv("KIRIN_GTFS_RT_MAX_FEED_SIZE", 50 * 1024 * 1024))
+# GTFS-RT entities with the same content as in the previous feed are skipped
+# (a fingerprint of each entity is stored in db)
+GTFS_RT_SKIP_UNCHANGED_ENTITIES = boolean(os.getenv("KIRIN_GTFS_RT_SKIP_UNCHANGED_ENTITIES", True))
+# number of trips whose vehicle journeys are searched with a single navitia query
+# (0 or 1 to search them one by one)
+GTFS_RT_NAVITIA_VJ_BATCH_SIZE = int(os.getenv("KIRIN_GTFS_RT_NAVITIA_VJ_BATCH_SIZE", 50))
 
 USE_GEVENT = boolean(os.getenv("KIRIN_USE_GEVENT", False))
 
+# maximum number of navitia requests made concurrently to prefetch the objects needed by a feed
+# (1 to make them one by one, when needed)
+NAVITIA_QUERY_POOL_SIZE = int(os.getenv("KIRIN_NAVITIA_QUERY_POOL_SIZE", 8))
+
+# Store stop_times of newly created trip_updates in a single jsonb column of trip_update
+# (instead of one row of stop_time_update per stop_time)
+USE_COMPACT_STOP_TIME_UPDATES = boolean(os.getenv("KIRIN_USE_COMPACT_STOP_TIME_UPDATES", False))
+
 DEBUG = boolean(os.getenv("KIRIN_DEBUG", False))
 
 # rabbitmq connections string: http://kombu.readthedocs.org/en/latest/userguide/connections.html#urls
@@ -91,6 +116,10 @@ NAVITIA_QUERY_CACHE_TIMEOUT = int(
 NAVITIA_PUBDATE_CACHE_TIMEOUT = int(
     os.getenv("KIRIN_NAVITIA_PUBDATE_CACHE_TIMEOUT", timedelta(minutes=5).total_seconds())
 )  # in seconds
+# navitia vehicle journeys of a train (COTS), cached until navitia data is published
+NAVITIA_SNCF_VJ_CACHE_TIMEOUT = int(
+    os.getenv("KIRIN_NAVITIA_SNCF_VJ_CACHE_TIMEOUT", timedelta(days=1).total_seconds())
+)  # in seconds
 
 CACHE_TYPE = os.getenv("KIRIN_CACHE_TYPE", "simple")
 
@@ -162,6 +191,18 @@ TASK_WAIT_FIXED = int(os.getenv("KIRIN_TASK_WAIT_FIXED", timedelta(seconds=2).to
 
 # Must be >= 1. Defines the minimal interval (seconds) between 2 tries for polling (can be longer if a task is running).
 POLLER_MIN_INTERVAL = int(os.getenv("KIRIN_POLLER_MIN_INTERVAL", timedelta(seconds=10).total_seconds()))
+# Adapt the interval between 2 pollings of each GTFS-RT contributor to the update rate of its feed
+# (between its min and max polling intervals, default to POLLER_MIN_INTERVAL and GTFS_RT_POLLER_MAX_INTERVAL)
+# Disabled by default: every contributor is polled every POLLER_MIN_INTERVAL
+GTFS_RT_ADAPTIVE_POLLING = boolean(os.getenv("KIRIN_GTFS_RT_ADAPTIVE_POLLING", False))
+GTFS_RT_POLLER_MAX_INTERVAL = int(
+    os.getenv("KIRIN_GTFS_RT_POLLER_MAX_INTERVAL", timedelta(minutes=5).total_seconds())
+)
+# Poll GTFS-RT feeds with the poll_gtfs_rt command (one process checking all feeds concurrently, only the new
+# feeds are processed by workers) instead of the 'poller' task (one task per contributor at each tick)
+GTFS_RT_CONCURRENT_POLLER = boolean(os.getenv("KIRIN_GTFS_RT_CONCURRENT_POLLER", False))
+# maximal number of feeds checked at the same time by the poll_gtfs_rt command
+GTFS_RT_POLLER_POOL_SIZE = int(os.getenv("KIRIN_GTFS_RT_POLLER_POOL_SIZE", 100))
 CELERYBEAT_SCHEDULE = {
     "poller": {
         "task": "kirin.tasks.poller",
@@ -193,3 +234,6 @@ CELERYBEAT_SCHEDULE = {
 # https://flask-sqlalchemy.palletsprojects.com/en/2.x/signals/
 # deprecated and slow
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# use psycopg2's execute_batch() for executemany (UPDATE/INSERT/DELETE of many StopTimeUpdates at once)
+SQLALCHEMY_ENGINE_OPTIONS = {"use_batch_mode": True}
@@ -113,7 +113,7 @@ class GtfsRT(Resource):
         except DecodeError:
             # We save the non-decodable flux gtfs-rt
             manage_db_error(
-                proto,
+                raw_proto,
                 "gtfs-rt",
                 contributor=contributor.id,
                 error="Decode Error",
@@ -121,5 +121,5 @@ class GtfsRT(Resource):
             )
             raise InvalidArguments("invalid protobuf")
         else:
-            model_maker.handle(proto, make_navitia_wrapper(contributor), contributor.id)
+            model_maker.handle(proto, make_navitia_wrapper(contributor), contributor.id, raw_proto=raw_proto)
             return {"message": "GTFS-RT feed processed"}, 200
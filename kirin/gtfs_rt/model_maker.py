@@ -30,6 +30,7 @@
 # www.navitia.io
 from __future__ import absolute_import, print_function, unicode_literals, division
 import datetime
+import hashlib
 import logging
 
 import six
@@ -44,26 +45,37 @@ from kirin.utils import (
     to_navitia_utc_str,
     set_rtu_status_ko,
     allow_reprocess_same_data,
+    call_concurrently,
 )
 from kirin.utils import record_internal_failure, record_call
 from kirin import app
 import itertools
 import calendar
 
+NAVITIA_VJ_CACHE_TIMEOUT = 1200
 
-def handle(proto, navitia_wrapper, contributor):
+
+def handle(proto, navitia_wrapper, contributor, raw_proto=None):
+    """
+    :param proto: parsed GTFS-RT FeedMessage
+    :param raw_proto: serialized protobuf received (saved as raw_data), proto is serialized again if not provided
+    """
     start_datetime = datetime.datetime.utcnow()
     rt_update = None
     log_dict = {"contributor": contributor}
     status = "OK"
 
     try:
-        data = six.binary_type(proto)  # temp, for the moment, we save the protobuf as text
+        data = raw_proto if raw_proto is not None else proto.SerializeToString()
         rt_update = make_rt_update(data, "gtfs-rt", contributor=contributor)
         log_dict.update({"input_timestamp": datetime.datetime.utcfromtimestamp(proto.header.timestamp)})
-        trip_updates = KirinModelBuilder(navitia_wrapper, contributor).build(rt_update, data=proto)
+        builder = KirinModelBuilder(navitia_wrapper, contributor)
+        trip_updates = builder.build(rt_update, data=proto)
+        log_dict.update({"skipped_entity_count": builder.nb_skipped_entities})
         _, handler_log_dict = core.handle(rt_update, trip_updates, contributor)
         log_dict.update(handler_log_dict)
+        # entities are known as processed only once successfully handled
+        builder.save_entity_fingerprints()
 
     except Exception as e:
         status = "failure"
@@ -106,6 +118,9 @@ class KirinModelBuilder(object):
         self.period_filter_tolerance = datetime.timedelta(hours=3)
         self.stop_code_key = "source"  # TODO conf
         self.instance_data_pub_date = self.navitia.get_publication_date()
+        self.nb_skipped_entities = 0
+        self.entity_fingerprints = {}  # fingerprints of entities built, by entity key
+        self.prefetched_vjs = {}  # VehicleJourneys found by _prefetch_navitia_vjs(), by _make_db_vj() arguments
 
     def build(self, rt_update, data):
         """
@@ -113,6 +128,8 @@ class KirinModelBuilder(object):
         and return a list of trip updates
 
         The TripUpdates are not yet associated with the RealTimeUpdate
+        Entities that did not change since their last processing are skipped
+        (see save_entity_fingerprints())
         """
         input_data_time = datetime.datetime.utcfromtimestamp(data.header.timestamp)
         self.log.debug(
@@ -120,20 +137,73 @@ class KirinModelBuilder(object):
         )
 
         trip_updates = []
+        known_fingerprints = None
+        if app.config.get(str("GTFS_RT_SKIP_UNCHANGED_ENTITIES")):
+            known_fingerprints = model.EntityFingerprint.find_by_contributor(self.contributor)
 
+        entities = []  # entities to build: (input trip_update, entity key, fingerprint)
         for entity in data.entity:
             if not entity.trip_update:
                 continue
-            tu = self._make_trip_updates(entity.trip_update, input_data_time=input_data_time)
+            entity_key, fingerprint = None, None
+            if known_fingerprints is not None:
+                # computed before building, as building modifies the entity
+                entity_key, fingerprint = self._make_entity_fingerprint(entity.trip_update, input_data_time)
+                known = known_fingerprints.get(entity_key)
+                if known is not None and known.fingerprint == fingerprint:
+                    self.nb_skipped_entities += 1
+                    continue
+            entities.append((entity.trip_update, entity_key, fingerprint))
+
+        self._prefetch_navitia_vjs([e[0].trip for e in entities], input_data_time=input_data_time)
+
+        for input_trip_update, entity_key, fingerprint in entities:
+            tu = self._make_trip_updates(input_trip_update, input_data_time=input_data_time)
+            if tu and known_fingerprints is not None:
+                self.entity_fingerprints[entity_key] = (known_fingerprints.get(entity_key), fingerprint)
             trip_updates.extend(tu)
 
-        if not trip_updates:
+        if self.nb_skipped_entities:
+            self.log.debug("{} unchanged entities skipped".format(self.nb_skipped_entities))
+
+        if not trip_updates and not self.nb_skipped_entities:
             msg = "No information for this gtfs-rt with timestamp: {}".format(data.header.timestamp)
             set_rtu_status_ko(rt_update, msg, is_reprocess_same_data_allowed=False)
             self.log.warning(msg)
 
         return trip_updates
 
+    def _make_entity_fingerprint(self, input_trip_update, input_data_time):
+        """
+        :return: key of the entity in feeds, and fingerprint of what its processing depends on:
+            its content, the period used to search its vj, and navitia's data
+        """
+        entity_key = "{}|{}".format(input_trip_update.trip.trip_id, input_trip_update.trip.start_date)
+        since_dt, _ = self._get_vj_search_period(input_data_time)
+        fingerprint = hashlib.sha1(input_trip_update.SerializeToString())
+        fingerprint.update("{}|{}".format(since_dt.isoformat(), self.instance_data_pub_date).encode("utf-8"))
+        return entity_key, fingerprint.hexdigest()
+
+    def save_entity_fingerprints(self):
+        """
+        Store fingerprints of the entities built, so that they are skipped in next feeds if unchanged
+        If they can't be stored, the entities are just built again next time
+        """
+        if not self.entity_fingerprints:
+            return
+        try:
+            for entity_key, (known, fingerprint) in self.entity_fingerprints.items():
+                if known is not None:
+                    known.fingerprint = fingerprint
+                else:
+                    model.db.session.add(model.EntityFingerprint(self.contributor, entity_key, fingerprint))
+            model.db.session.commit()
+        except Exception as e:
+            # the session is left usable
+            model.db.session.rollback()
+            self.log.warning("fingerprints of entities not saved: {}".format(e))
+        self.entity_fingerprints = {}
+
     def _get_stop_code(self, nav_stop):
         for c in nav_stop.get("codes", []):
             if c["type"] == self.stop_code_key:
@@ -210,7 +280,7 @@ class KirinModelBuilder(object):
         """
         return "{}.{}.{}".format(self.__class__, self.navitia.url, self.instance_data_pub_date)
 
-    @app.cache.memoize(timeout=1200)
+    @app.cache.memoize(timeout=NAVITIA_VJ_CACHE_TIMEOUT)
     def _make_db_vj(self, vj_source_code, since_dt, until_dt):
         """
         Search for navitia's vehicle journeys with given code, in the period provided
@@ -230,7 +300,12 @@ class KirinModelBuilder(object):
                 "depth": "2",  # we need this depth to get the stoptime's stop_area
             }
         )
+        return self._make_vjs(vj_source_code, navitia_vjs, since_dt, until_dt)
 
+    def _make_vjs(self, vj_source_code, navitia_vjs, since_dt, until_dt):
+        """
+        Make kirin VehicleJourney from the navitia vehicle journeys found for given code, in the period provided
+        """
         if not navitia_vjs:
             self.log.info(
                 "impossible to find vj {t} on [{s}, {u}]".format(t=vj_source_code, s=since_dt, u=until_dt)
@@ -258,11 +333,96 @@ class KirinModelBuilder(object):
             record_internal_failure("Error while creating kirin VJ", contributor=self.contributor)
             return []
 
-    def _get_navitia_vjs(self, trip, input_data_time):
-        vj_source_code = trip.trip_id
+    def _make_db_vj_cache_key(self, vj_source_code, since_dt, until_dt):
+        make_db_vj = KirinModelBuilder._make_db_vj
+        return make_db_vj.make_cache_key(make_db_vj.uncached, self, vj_source_code, since_dt, until_dt)
 
+    def _prefetch_navitia_vjs(self, trips, input_data_time):
+        """
+        Search navitia's vehicle journeys of all given trips not in cache, before building them:
+        * by batches of GTFS_RT_NAVITIA_VJ_BATCH_SIZE trips per navitia query instead of one query per trip,
+        * then one by one for trips not resolved by batches (query failed, possibly truncated result,
+          navitia vehicle journey without code).
+        Navitia queries are made concurrently (see call_concurrently()).
+        VehicleJourneys made are cached as if found by _make_db_vj().
+        """
+        batch_size = app.config.get(str("GTFS_RT_NAVITIA_VJ_BATCH_SIZE"), 0)
+        since_dt, until_dt = self._get_vj_search_period(input_data_time)
+        vj_source_codes = sorted(
+            {
+                trip.trip_id
+                for trip in trips
+                if app.cache.get(self._make_db_vj_cache_key(trip.trip_id, since_dt, until_dt)) is None
+            }
+        )
+        if batch_size >= 2 and len(vj_source_codes) >= 2:
+            batches = [
+                (tuple(vj_source_codes[i : i + batch_size]), since_dt, until_dt)
+                for i in range(0, len(vj_source_codes), batch_size)
+            ]
+            for batch_vjs in call_concurrently(self._search_navitia_vjs_batch, batches).values():
+                self.prefetched_vjs.update(batch_vjs)
+
+        remaining_searches = [
+            (code, since_dt, until_dt)
+            for code in vj_source_codes
+            if (code, since_dt, until_dt) not in self.prefetched_vjs
+        ]
+        self.prefetched_vjs.update(call_concurrently(self._make_db_vj, remaining_searches))
+
+    def _search_navitia_vjs_batch(self, vj_source_codes, since_dt, until_dt):
+        """
+        Search navitia's vehicle journeys of given codes with a single query
+        :return: dict of the VehicleJourneys made for each code, by _make_db_vj() arguments
+            (empty if the result cannot be dispatched on codes)
+        """
+        max_nb_vjs = 2 * len(vj_source_codes)  # more than that is unexpected, so result is considered truncated
+        navitia_vjs = self.navitia.vehicle_journeys(
+            q={
+                "filter": " or ".join(
+                    "vehicle_journey.has_code({}, {})".format(self.stop_code_key, code)
+                    for code in vj_source_codes
+                ),
+                "since": to_navitia_utc_str(since_dt),
+                "until": to_navitia_utc_str(until_dt),
+                "depth": "2",  # we need this depth to get the stoptime's stop_area
+                "count": six.text_type(max_nb_vjs),
+            }
+        )
+        if len(navitia_vjs) >= max_nb_vjs:
+            return {}
+
+        navitia_vjs_by_code = {code: [] for code in vj_source_codes}
+        for nav_vj in navitia_vjs:
+            codes = [c["value"] for c in nav_vj.get("codes", []) if c.get("type") == self.stop_code_key]
+            matching_codes = [code for code in codes if code in navitia_vjs_by_code]
+            if not matching_codes:
+                self.log.info("vj {} found without its code, batch is not dispatched".format(nav_vj.get("id")))
+                return {}
+            for code in matching_codes:
+                navitia_vjs_by_code[code].append(nav_vj)
+
+        vjs_by_search = {}
+        for code, code_navitia_vjs in navitia_vjs_by_code.items():
+            vjs = self._make_vjs(code, code_navitia_vjs, since_dt, until_dt)
+            vjs_by_search[(code, since_dt, until_dt)] = vjs
+            app.cache.set(
+                self._make_db_vj_cache_key(code, since_dt, until_dt), vjs, timeout=NAVITIA_VJ_CACHE_TIMEOUT
+            )
+        return vjs_by_search
+
+    def _get_vj_search_period(self, input_data_time):
         since_dt = floor_datetime(input_data_time - self.period_filter_tolerance)
         until_dt = floor_datetime(input_data_time + self.period_filter_tolerance + datetime.timedelta(hours=1))
+        return since_dt, until_dt
+
+    def _get_navitia_vjs(self, trip, input_data_time):
+        vj_source_code = trip.trip_id
+
+        since_dt, until_dt = self._get_vj_search_period(input_data_time)
+        prefetched_vjs = self.prefetched_vjs.get((vj_source_code, since_dt, until_dt))
+        if prefetched_vjs is not None:
+            return prefetched_vjs
         self.log.debug("searching for vj {} on [{}, {}] in navitia".format(vj_source_code, since_dt, until_dt))
 
         return self._make_db_vj(vj_source_code, since_dt, until_dt)
@@ -0,0 +1,126 @@
+# coding=utf-8
+
+# Copyright (c) 2001-2018, Canal TP and/or its affiliates. All rights reserved.
+#
+# This file is part of Navitia,
+#     the software to build cool stuff with public transport.
+#
+# Hope you'll enjoy and contribute to this project,
+#     powered by Canal TP (www.canaltp.fr).
+# Help us simplify mobility and open public transport:
+#     a non ending quest to the responsive locomotion way of traveling!
+#
+# LICENCE: This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Stay tuned using
+# twitter @navitia
+# IRC #navitia on freenode
+# https://groups.google.com/d/forum/navitia
+# www.navitia.io
+
+
+"""
+Concurrent polling engine of GTFS-RT contributors
+
+A single long-lived process (with gevent) checks the feeds of all contributors concurrently, at each tick of
+POLLER_MIN_INTERVAL (following the adaptive polling schedule). Only the new feeds are dispatched to the
+celery workers for processing (gtfs_processor task), the feed being handed over in Redis.
+The lock of each contributor is the one of gtfs_poller: a feed is not checked while the previous one of the
+contributor is being checked or processed.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals, division
+import logging
+import time
+
+import gevent
+from gevent.pool import Pool
+
+from kirin import app, redis_client
+from kirin.gtfs_rt import polling
+from kirin.gtfs_rt.tasks import check_feed, record_polling, gtfs_processor
+from kirin.utils import make_kirin_lock_name, get_lock, build_redis_pending_feed_key
+
+
+def check_contributor(config):
+    """
+    Check the feed of the contributor, and dispatch its processing if it's new
+    """
+    contributor = config["contributor"]
+    logger = logging.LoggerAdapter(logging.getLogger(__name__), extra={"contributor": contributor})
+    logger.debug("polling of %s", config["feed_url"])
+
+    lock_name = make_kirin_lock_name("gtfs_poller", contributor)
+    with app.app_context():
+        outcome = None
+        with get_lock(logger, lock_name, app.config[str("REDIS_LOCK_TIMEOUT_POLLER")]) as locked:
+            if not locked:
+                return
+            pending_feed_key = build_redis_pending_feed_key(contributor)
+            if redis_client.exists(pending_feed_key):
+                logger.debug("last feed of %s is not processed yet, skipping the polling", contributor)
+                return
+
+            outcome, proto = polling.ERROR, None
+            try:
+                outcome, proto, content = check_feed(config, logger)
+                if outcome == polling.NEW:
+                    # the pending feed expires with the lock, in case it's never processed
+                    redis_client.set(pending_feed_key, content, ex=app.config[str("REDIS_LOCK_TIMEOUT_POLLER")])
+            finally:
+                record_polling(config, outcome, proto)
+
+        # the lock is released before dispatching, for the processing to take it
+        if outcome == polling.NEW:
+            gtfs_processor.delay(config)
+
+
+def _safe_check_contributor(config):
+    try:
+        check_contributor(config)
+    except Exception:
+        logging.getLogger(__name__).exception("polling of %s failed", config["contributor"])
+
+
+def run():
+    """
+    Poll the GTFS-RT contributors until the process is stopped
+    """
+    logger = logging.getLogger(__name__)
+    if not app.config.get(str("USE_GEVENT")):
+        logger.error("the concurrent poller needs gevent, KIRIN_USE_GEVENT must be set")
+        return
+
+    pool = Pool(app.config[str("GTFS_RT_POLLER_POOL_SIZE")])
+    checks = {}  # last check of each contributor
+    interval = app.config[str("POLLER_MIN_INTERVAL")]
+    logger.info("polling GTFS-RT contributors every %s seconds", interval)
+    while True:
+        start = time.time()
+        try:
+            with app.app_context():
+                configs = polling.get_polling_configs()
+        except Exception:
+            logger.exception("failed to get GTFS-RT contributors to poll")
+            configs = []
+
+        for config in configs:
+            last_check = checks.get(config["contributor"])
+            if last_check is not None and not last_check.ready():
+                continue  # feed still being checked
+            checks[config["contributor"]] = pool.spawn(_safe_check_contributor, config)
+
+        # forget contributors that are not polled anymore
+        checks = {contributor: check for contributor, check in checks.items() if not check.ready()}
+        gevent.sleep(max(0, interval - (time.time() - start)))
@@ -0,0 +1,210 @@
+# coding=utf-8
+
+# Copyright (c) 2001-2018, Canal TP and/or its affiliates. All rights reserved.
+#
+# This file is part of Navitia,
+#     the software to build cool stuff with public transport.
+#
+# Hope you'll enjoy and contribute to this project,
+#     powered by Canal TP (www.canaltp.fr).
+# Help us simplify mobility and open public transport:
+#     a non ending quest to the responsive locomotion way of traveling!
+#
+# LICENCE: This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Stay tuned using
+# twitter @navitia
+# IRC #navitia on freenode
+# https://groups.google.com/d/forum/navitia
+# www.navitia.io
+
+"""
+Adaptive polling schedule of GTFS-RT contributors
+
+Each polling's outcome (new feed, no new feed, error) is recorded in Redis, in the polling state of the
+contributor. The period between 2 updates of the feed is learnt from the timestamps of the new feeds
+(from their detection if feeds have no timestamp), so that the feed is polled again just before its next
+expected update, then at the min interval until this update is detected. Idle or failing feeds are polled
+less and less often (exponential back-off), up to the max interval.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals, division
+import logging
+import time
+
+import six
+
+from kirin import app, redis_client
+from kirin.utils import build_redis_polling_state_key
+from kirin.gtfs_rt.gtfs_rt import get_gtfsrt_contributors
+
+NEW = "new"
+NO_NEW = "no_new"
+ERROR = "error"
+
+# weight of the last period observed in the estimated period between 2 updates of a feed
+PERIOD_SMOOTHING = 0.5
+
+
+def get_polling_intervals(contributor):
+    """
+    :return: the (min, max) interval in seconds between 2 pollings of the contributor
+    """
+    min_interval = contributor.min_polling_interval or app.config[str("POLLER_MIN_INTERVAL")]
+    max_interval = contributor.max_polling_interval or app.config[str("GTFS_RT_POLLER_MAX_INTERVAL")]
+    # the contributor's intervals are checked by the contributors API, but not against the default ones
+    return min_interval, max(min_interval, max_interval)
+
+
+def compute_polling_state(state, outcome, now, min_interval, max_interval, feed_timestamp=None):
+    """
+    Compute the polling state of a contributor after a polling
+
+    :param state: dict of the previous state (empty if unknown):
+        'period': estimated period between 2 updates of the feed (seconds),
+        'last_change': timestamp of the last new feed detected,
+        'last_feed_timestamp': timestamp of the last new feed (from its header),
+        'nb_idle': number of consecutive pollings without new feed,
+        'nb_errors': number of consecutive pollings in error,
+        'next_poll': timestamp of the next polling
+    :param outcome: outcome of the polling (NEW, NO_NEW or ERROR)
+    :param now: timestamp of the end of the polling
+    :param feed_timestamp: timestamp of the new feed (from its header), if any
+
+    >>> state = compute_polling_state({}, NEW, 1000, 10, 300)
+    >>> state['next_poll'], state['nb_idle']
+    (1010.0, 0)
+    >>> state = compute_polling_state(state, NEW, 1060, 10, 300)  # polled again before the next update
+    >>> state['period'], state['next_poll']
+    (60.0, 1110.0)
+    >>> state = compute_polling_state(state, NO_NEW, 1120, 10, 300)  # late update, polled soon
+    >>> state['next_poll'], state['nb_idle']
+    (1130.0, 1)
+    >>> state = compute_polling_state(state, NO_NEW, 1300, 10, 300)  # idle feed, backing off
+    >>> state['next_poll'], state['nb_idle']
+    (1340.0, 2)
+    >>> state = compute_polling_state(state, ERROR, 1340, 10, 300)
+    >>> state['next_poll'], state['nb_errors']
+    (1360.0, 1)
+    >>> state = compute_polling_state({}, NEW, 2000, 10, 300, feed_timestamp=1990)
+    >>> state = compute_polling_state(state, NEW, 2035, 10, 300, feed_timestamp=2020)  # from feed timestamps
+    >>> state['period'], state['next_poll']
+    (30.0, 2055.0)
+    """
+    state = dict(state)
+    period = state.get("period")
+    last_change = state.get("last_change")
+    last_feed_timestamp = state.get("last_feed_timestamp")
+
+    if outcome == NEW:
+        observed_period = None
+        if feed_timestamp and last_feed_timestamp and feed_timestamp > last_feed_timestamp:
+            # the feed's own cadence, without the delay of its detection
+            observed_period = float(feed_timestamp - last_feed_timestamp)
+        elif last_change is not None:
+            observed_period = float(now - last_change)
+        if observed_period is not None:
+            if period is None:
+                period = observed_period
+            else:
+                period = PERIOD_SMOOTHING * observed_period + (1 - PERIOD_SMOOTHING) * period
+        state.update(
+            period=period, last_change=now, last_feed_timestamp=feed_timestamp or None, nb_idle=0, nb_errors=0
+        )
+        # polled just before the next expected update, for a faster update to be detected (and learnt)
+        interval = period - min_interval if period is not None else min_interval
+    elif outcome == NO_NEW:
+        state["nb_errors"] = 0
+        state["nb_idle"] = nb_idle = state.get("nb_idle", 0) + 1
+        if period is not None and last_change is not None and now < last_change + 2 * period:
+            interval = min_interval  # next update is expected soon
+        else:
+            interval = min_interval * 2 ** nb_idle
+    else:
+        state["nb_errors"] = nb_errors = state.get("nb_errors", 0) + 1
+        interval = min_interval * 2 ** nb_errors
+
+    state["next_poll"] = float(now + min(max(interval, min_interval), max_interval))
+    return state
+
+
+def _load_state(raw_state):
+    return {k.decode("utf-8"): float(v) for k, v in raw_state.items()}
+
+
+def record_polling(contributor_id, outcome, min_interval, max_interval, feed_timestamp=None):
+    """
+    Record the outcome of a polling of the contributor (and the timestamp of its new feed, if any),
+    to schedule its next polling
+    If Redis fails, the contributor is polled at each tick of the poller.
+    """
+    key = build_redis_polling_state_key(contributor_id)
+    try:
+        state = _load_state(redis_client.hgetall(key))
+        state = compute_polling_state(state, outcome, time.time(), min_interval, max_interval, feed_timestamp)
+        pipe = redis_client.pipeline()
+        pipe.delete(key)
+        pipe.hmset(key, {k: v for k, v in state.items() if v is not None})
+        pipe.execute()
+    except Exception as e:
+        logging.getLogger(__name__).warning(
+            "exception occurred when recording polling of %s: %s", contributor_id, six.text_type(e)
+        )
+
+
+def get_contributors_to_poll(contributor_ids):
+    """
+    :return: set of the contributors (among given ones) to poll now
+    If Redis fails, all contributors are polled.
+    """
+    now = time.time()
+    try:
+        pipe = redis_client.pipeline()
+        for contributor_id in contributor_ids:
+            pipe.hget(build_redis_polling_state_key(contributor_id), "next_poll")
+        next_polls = pipe.execute()
+    except Exception as e:
+        logging.getLogger(__name__).warning("exception occurred when scheduling pollings: %s", six.text_type(e))
+        return set(contributor_ids)
+    return {
+        contributor_id
+        for contributor_id, next_poll in zip(contributor_ids, next_polls)
+        if next_poll is None or float(next_poll) <= now
+    }
+
+
+def get_polling_configs():
+    """
+    :return: the polling configs of the GTFS-RT contributors to poll now
+    """
+    contributors = get_gtfsrt_contributors()
+    if app.config.get(str("GTFS_RT_ADAPTIVE_POLLING")):
+        to_poll = get_contributors_to_poll([c.id for c in contributors])
+        contributors = [c for c in contributors if c.id in to_poll]
+    configs = []
+    for contributor in contributors:
+        min_polling_interval, max_polling_interval = get_polling_intervals(contributor)
+        configs.append(
+            {
+                "contributor": contributor.id,
+                "navitia_url": app.config.get(str("NAVITIA_URL")),
+                "token": contributor.navitia_token,
+                "coverage": contributor.navitia_coverage,
+                "feed_url": contributor.feed_url,
+                "timeout": app.config.get(str("GTFS_RT_TIMEOUT"), 1),
+                "min_polling_interval": min_polling_interval,
+                "max_polling_interval": max_polling_interval,
+            }
+        )
+    return configs
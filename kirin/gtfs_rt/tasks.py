@@ -30,10 +30,10 @@
 # www.navitia.io
 
 from __future__ import absolute_import, print_function, unicode_literals, division
+import hashlib
 import logging
 from datetime import datetime
 
-import requests
 import six
 
 from kirin import gtfs_realtime_pb2
@@ -46,9 +46,15 @@ from kirin.utils import (
     manage_db_error,
     manage_db_no_new,
     build_redis_etag_key,
+    build_redis_last_modified_key,
+    build_redis_feed_digest_key,
+    build_redis_feed_timestamp_key,
+    build_redis_pending_feed_key,
+    allow_reprocess_same_data,
     record_input_retrieval,
 )
-from kirin.gtfs_rt import model_maker
+from kirin.gtfs_rt import model_maker, polling
+from kirin.http_sessions import get_session
 from retrying import retry
 from kirin import app, redis_client
 from kirin import new_relic
@@ -64,41 +70,192 @@ class InvalidFeed(Exception):
     pass
 
 
-def _is_newer(config):
-    logger = logging.LoggerAdapter(logging.getLogger(__name__), extra={"contributor": config["contributor"]})
-    contributor = config["contributor"]
+def _get_feed_validators(contributor):
+    """
+    :return: the validators (ETag, Last-Modified) of the last feed retrieved, as conditional request headers
+    """
     try:
-        head = requests.head(config["feed_url"], timeout=config.get("timeout", 1))
+        etag, last_modified = redis_client.mget(
+            build_redis_etag_key(contributor), build_redis_last_modified_key(contributor)
+        )
+    except Exception as e:
+        # if Redis fails, we just do a regular GET
+        logging.getLogger(__name__).debug(
+            "exception occurred when getting validators of gtfs-rt for %s: %s", contributor, six.text_type(e)
+        )
+        return {}
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
 
-        new_etag = head.headers.get("ETag")
-        if not new_etag:
-            return True  # unable to get a ETag, we continue the polling
 
-        etag_key = build_redis_etag_key(contributor)
-        old_etag = redis_client.get(etag_key)
+def _save_feed_validators(contributor, response):
+    try:
+        for key, header in [
+            (build_redis_etag_key(contributor), "ETag"),
+            (build_redis_last_modified_key(contributor), "Last-Modified"),
+        ]:
+            value = response.headers.get(header)
+            if value:
+                redis_client.set(key, value)
+            else:
+                redis_client.delete(key)
+    except Exception as e:
+        logging.getLogger(__name__).debug(
+            "exception occurred when saving validators of gtfs-rt for %s: %s", contributor, six.text_type(e)
+        )
 
-        if new_etag == old_etag:
-            logger.info("get the same ETag of %s, skipping the polling for %s", etag_key, contributor)
-            return False
 
-        redis_client.set(etag_key, new_etag)
+def _read_content(response, max_size):
+    """
+    Read the (decoded) content of the response, raise InvalidFeed if it's bigger than max_size bytes
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        raise InvalidFeed("feed is too large ({} bytes)".format(content_length))
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > max_size:
+            raise InvalidFeed("feed is too large (more than {} bytes)".format(max_size))
+        chunks.append(chunk)
+    return b"".join(chunks)
+
 
+def _is_new_feed(contributor, proto, content):
+    """
+    Check the freshness of a feed retrieved (useful for providers not sending validators):
+    the feed is new if its content is different from the last feed processed, and its header's
+    timestamp is not older than that of the last feed processed.
+    If the feed is new, it's remembered as the last feed processed.
+    If Redis fails, the feed is considered new.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    timestamp = proto.header.timestamp
+    digest_key = build_redis_feed_digest_key(contributor)
+    timestamp_key = build_redis_feed_timestamp_key(contributor)
+    try:
+        last_digest, last_timestamp = redis_client.mget(digest_key, timestamp_key)
+        if last_digest is not None and last_digest.decode("ascii") == digest:
+            logging.getLogger(__name__).info("gtfs-rt of %s is identical to the last one processed", contributor)
+            return False
+        if timestamp and last_timestamp and timestamp < int(last_timestamp):
+            logging.getLogger(__name__).info("gtfs-rt of %s is older than the last one processed", contributor)
+            return False
+        redis_client.mset({digest_key: digest, timestamp_key: timestamp})
     except Exception as e:
-        logger.debug(
-            "exception occurred when checking the newer version of gtfs for %s: %s",
-            contributor,
-            six.text_type(e),
+        logging.getLogger(__name__).debug(
+            "exception occurred when checking freshness of gtfs-rt for %s: %s", contributor, six.text_type(e)
         )
-    return True  # whatever the exception is, we don't want to break the polling
+    return True
 
 
 @new_relic.agent.function_trace()  # trace it specifically in transaction times
 def _retrieve_gtfsrt(config):
+    """
+    Retrieve the feed with a single conditional GET (using the validators of the last feed retrieved).
+    The feed may be gzip-encoded, its size is limited to GTFS_RT_MAX_FEED_SIZE bytes.
+    :return: the content of the feed (None if the feed is not modified since last retrieval)
+    """
     start_dt = datetime.utcnow()
-    resp = requests.get(config["feed_url"], timeout=config.get("timeout", 1))
+    contributor = config["contributor"]
+    headers = _get_feed_validators(contributor)
+    headers["Accept-Encoding"] = "gzip, deflate"
+    resp = get_session(config["feed_url"]).get(
+        config["feed_url"], headers=headers, timeout=config.get("timeout", 1), stream=True
+    )
+    try:
+        resp.raise_for_status()
+        # reading the whole (possibly empty) body allows the connection to be reused
+        content = _read_content(resp, app.config.get(str("GTFS_RT_MAX_FEED_SIZE")))
+    finally:
+        resp.close()
     duration_ms = (datetime.utcnow() - start_dt).total_seconds() * 1000
-    record_input_retrieval(contributor=config["contributor"], duration_ms=duration_ms)
-    return resp
+    record_input_retrieval(contributor=contributor, duration_ms=duration_ms)
+    if resp.status_code == 304:
+        return None
+    _save_feed_validators(contributor, resp)
+    return content
+
+
+def check_feed(config, logger):
+    """
+    Retrieve the feed of the contributor and check if it's new
+    :return: the outcome of the polling (see polling module), and the feed (parsed and raw) if it's new
+    """
+    contributor = config["contributor"]
+    # The feed is only transferred if it changed since the last polling (conditional GET)
+    # If Redis fails, we just ignore this part and get the feed anyway
+    try:
+        content = _retrieve_gtfsrt(config)
+    except Exception as e:
+        manage_db_error(
+            data="",
+            connector="gtfs-rt",
+            contributor=contributor,
+            error="Http Error",
+            is_reprocess_same_data_allowed=True,
+        )
+        logger.debug(six.text_type(e))
+        return polling.ERROR, None, None
+
+    if content is None:
+        logger.info("gtfs-rt not modified since last polling, skipping the polling for %s", contributor)
+        new_relic.ignore_transaction()
+        manage_db_no_new(connector="gtfs-rt", contributor=contributor)
+        return polling.NO_NEW, None, None
+
+    proto = gtfs_realtime_pb2.FeedMessage()
+    try:
+        proto.ParseFromString(content)
+    except DecodeError:
+        manage_db_error(
+            content,
+            "gtfs-rt",
+            contributor=contributor,
+            error="Decode Error",
+            is_reprocess_same_data_allowed=False,
+        )
+        logger.debug("invalid protobuf")
+        return polling.ERROR, None, None
+
+    # Identical or stale feeds are skipped before any processing
+    if not _is_new_feed(contributor, proto, content):
+        new_relic.ignore_transaction()
+        manage_db_no_new(connector="gtfs-rt", contributor=contributor)
+        return polling.NO_NEW, None, None
+
+    return polling.NEW, proto, content
+
+
+def process_feed(config, proto, content):
+    nav = navitia_wrapper.Navitia(
+        url=config["navitia_url"],
+        token=config["token"],
+        timeout=app.config.get(str("NAVITIA_TIMEOUT"), 5),
+        cache=redis_client,
+        query_timeout=app.config.get(str("NAVITIA_QUERY_CACHE_TIMEOUT"), 600),
+        pubdate_timeout=app.config.get(str("NAVITIA_PUBDATE_CACHE_TIMEOUT"), 600),
+    ).instance(config["coverage"])
+    model_maker.handle(proto, nav, config["contributor"], raw_proto=content)
+
+
+def record_polling(config, outcome, proto=None):
+    """
+    Schedule the next polling of the contributor according to the outcome of this one (and its new feed)
+    """
+    if app.config.get(str("GTFS_RT_ADAPTIVE_POLLING")):
+        polling.record_polling(
+            config["contributor"],
+            outcome,
+            config.get("min_polling_interval", app.config[str("POLLER_MIN_INTERVAL")]),
+            config.get("max_polling_interval", app.config[str("GTFS_RT_POLLER_MAX_INTERVAL")]),
+            feed_timestamp=proto.header.timestamp if proto is not None else None,
+        )
 
 
 @celery.task(bind=True)  # type: ignore
@@ -115,49 +272,52 @@ def gtfs_poller(self, config):
             new_relic.ignore_transaction()
             return
 
-        # We do a HEAD request at the very beginning of polling and we compare it with the previous one to check if
-        # the gtfs-rt is changed.
-        # If the HEAD request or Redis get/set fail, we just ignore this part and do the polling anyway
-        if not _is_newer(config):
-            new_relic.ignore_transaction()
-            manage_db_no_new(connector="gtfs-rt", contributor=contributor)
-            return
-
+        outcome, proto = polling.ERROR, None
         try:
-            response = _retrieve_gtfsrt(config)
-            response.raise_for_status()
-        except Exception as e:
-            manage_db_error(
-                data="",
-                connector="gtfs-rt",
-                contributor=contributor,
-                error="Http Error",
-                is_reprocess_same_data_allowed=True,
-            )
-            logger.debug(six.text_type(e))
-            return
+            outcome, proto, content = check_feed(config, logger)
+            if outcome == polling.NEW:
+                process_feed(config, proto, content)
+        finally:
+            record_polling(config, outcome, proto)
+        if outcome == polling.NEW:
+            logger.info("%s for %s is finished", func_name, contributor)
 
-        nav = navitia_wrapper.Navitia(
-            url=config["navitia_url"],
-            token=config["token"],
-            timeout=app.config.get(str("NAVITIA_TIMEOUT"), 5),
-            cache=redis_client,
-            query_timeout=app.config.get(str("NAVITIA_QUERY_CACHE_TIMEOUT"), 600),
-            pubdate_timeout=app.config.get(str("NAVITIA_PUBDATE_CACHE_TIMEOUT"), 600),
-        ).instance(config["coverage"])
 
+@celery.task(bind=True)  # type: ignore
+@retry(stop_max_delay=TASK_STOP_MAX_DELAY, wait_fixed=TASK_WAIT_FIXED, retry_on_exception=should_retry_exception)
+def gtfs_processor(self, config):
+    """
+    Process the new feed of the contributor found by the concurrent poller (see poller module),
+    under the same lock as gtfs_poller
+    """
+    func_name = "gtfs_processor"
+    logger = logging.LoggerAdapter(logging.getLogger(__name__), extra={"contributor": config["contributor"]})
+
+    contributor = config["contributor"]
+    pending_feed_key = build_redis_pending_feed_key(contributor)
+    lock_name = make_kirin_lock_name("gtfs_poller", contributor)
+    with get_lock(logger, lock_name, app.config[str("REDIS_LOCK_TIMEOUT_POLLER")]) as locked:
+        if not locked:
+            # the feed will be retrieved and processed again at next polling
+            logger.warning("%s for %s: polling already in progress, feed is dropped", func_name, contributor)
+            redis_client.delete(pending_feed_key)
+            allow_reprocess_same_data(contributor)
+            return
+
+        content = redis_client.get(pending_feed_key)
+        if content is None:
+            # the feed will be retrieved and processed again at next polling
+            logger.warning("%s for %s: pending feed expired", func_name, contributor)
+            allow_reprocess_same_data(contributor)
+            return
         proto = gtfs_realtime_pb2.FeedMessage()
+        proto.ParseFromString(content)
         try:
-            proto.ParseFromString(response.content)
-        except DecodeError:
-            manage_db_error(
-                proto,
-                "gtfs-rt",
-                contributor=contributor,
-                error="Decode Error",
-                is_reprocess_same_data_allowed=False,
-            )
-            logger.debug("invalid protobuf")
-        else:
-            model_maker.handle(proto, nav, contributor)
-            logger.info("%s for %s is finished", func_name, contributor)
+            process_feed(config, proto, content)
+        except Exception as e:
+            # the pending feed is kept for the task to be retried
+            if not should_retry_exception(e):
+                redis_client.delete(pending_feed_key)
+            raise
+        redis_client.delete(pending_feed_key)
+        logger.info("%s for %s is finished", func_name, contributor)
@@ -0,0 +1,91 @@
+# coding=utf-8
+
+# Copyright (c) 2001-2018, Canal TP and/or its affiliates. All rights reserved.
+#
+# This file is part of Navitia,
+#     the software to build cool stuff with public transport.
+#
+# Hope you'll enjoy and contribute to this project,
+#     powered by Canal TP (www.canaltp.fr).
+# Help us simplify mobility and open public transport:
+#     a non ending quest to the responsive locomotion way of traveling!
+#
+# LICENCE: This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Stay tuned using
+# twitter @navitia
+# IRC #navitia on freenode
+# https://groups.google.com/d/forum/navitia
+# www.navitia.io
+
+from __future__ import absolute_import, print_function, unicode_literals, division
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from six.moves.urllib.parse import urlparse
+
+from kirin import app
+
+_sessions = {}  # HTTP sessions by (process id, scheme, host)
+_sessions_lock = threading.Lock()
+
+
+def get_session(url):
+    """
+    Get the HTTP session used by this worker for all requests to the host of given url.
+    Its connections are kept alive and pooled, so that TCP (and TLS) handshakes are not made on each request.
+    """
+    scheme, netloc = urlparse(url)[:2]
+    # connections must not be shared by processes (celery workers are forked)
+    key = (os.getpid(), scheme, netloc)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _make_session()
+                _sessions[key] = session
+    return session
+
+
+def _make_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,  # a session is dedicated to a single host
+        pool_maxsize=app.config.get(str("HTTP_POOL_MAXSIZE"), 10),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_sessions_status():
+    """
+    :return: for each host requested by this worker, the number of requests made and of connections opened
+        (the difference being the number of requests that reused a connection)
+    """
+    status = {}
+    for (pid, scheme, netloc), session in list(_sessions.items()):
+        if pid != os.getpid():
+            continue
+        pools = session.get_adapter("{}://".format(scheme)).poolmanager.pools
+        host_status = status.setdefault("{}://{}".format(scheme, netloc), {"requests": 0, "connections": 0})
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is not None:
+                host_status["requests"] += pool.num_requests
+                host_status["connections"] += pool.num_connections
+    return status
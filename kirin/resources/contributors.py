@@ -45,8 +45,25 @@ contributor_fields = {
     "feed_url": fields.String,
     "connector_type": fields.String,
     "is_active": fields.Boolean,
+    "min_polling_interval": fields.Integer(default=None),
+    "max_polling_interval": fields.Integer(default=None),
 }
 
+
+def check_polling_intervals(min_polling_interval, max_polling_interval):
+    if (
+        min_polling_interval is not None
+        and max_polling_interval is not None
+        and min_polling_interval > max_polling_interval
+    ):
+        abort(
+            400,
+            message="min_polling_interval ({}) can't be greater than max_polling_interval ({})".format(
+                min_polling_interval, max_polling_interval
+            ),
+        )
+
+
 contributors_list_fields = {"contributors": fields.List(fields.Nested(contributor_fields))}
 contributor_nested_fields = {"contributor": fields.Nested(contributor_fields)}
 
@@ -60,6 +77,8 @@ class Contributors(Resource):
         "feed_url": {"type": "string", "format": "uri"},
         "connector_type": {"type": "string", "enum": ConnectorType.values()},
         "is_active": {"type": "boolean"},
+        "min_polling_interval": {"type": ["integer", "null"], "minimum": 1},
+        "max_polling_interval": {"type": ["integer", "null"], "minimum": 1},
     }
 
     post_data_schema = {
@@ -94,10 +113,20 @@ class Contributors(Resource):
         token = data.get("navitia_token", None)
         feed_url = data.get("feed_url", None)
         is_active = data.get("is_active", True)
+        min_polling_interval = data.get("min_polling_interval", None)
+        max_polling_interval = data.get("max_polling_interval", None)
+        check_polling_intervals(min_polling_interval, max_polling_interval)
 
         try:
             new_contrib = model.Contributor(
-                id, data["navitia_coverage"], data["connector_type"], token, feed_url, is_active
+                id,
+                data["navitia_coverage"],
+                data["connector_type"],
+                token,
+                feed_url,
+                is_active,
+                min_polling_interval,
+                max_polling_interval,
             )
             model.db.session.add(new_contrib)
             model.db.session.commit()
@@ -124,6 +153,13 @@ class Contributors(Resource):
         if id is None:
             abort(400, message="Contributor's id is missing")
 
+        contributor = model.Contributor.query.get(id)
+        if contributor is not None:
+            check_polling_intervals(
+                data.get("min_polling_interval", contributor.min_polling_interval),
+                data.get("max_polling_interval", contributor.max_polling_interval),
+            )
+
         try:
             # As we should not update id, delete it from data if exists
             if "id" in data:
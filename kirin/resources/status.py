@@ -41,6 +41,7 @@ from kirin.utils import (
     can_connect_to_database,
     get_database_pool_status,
 )
+from kirin.http_sessions import get_sessions_status
 
 
 class Status(Resource):
@@ -48,6 +49,7 @@ class Status(Resource):
         res = get_database_info()
         res["version"] = version
         res["db_pool_status"] = get_database_pool_status()
+        res["http_sessions_status"] = get_sessions_status()
         res["db_version"] = get_database_version()
         res["navitia_url"] = current_app.config[str("NAVITIA_URL")]
         res["rabbitmq_info"] = kirin.rabbitmq_handler.info()
@@ -40,7 +40,7 @@ from kirin.helper import make_celery
 from retrying import retry
 from kirin import app
 import datetime
-from kirin.core.model import TripUpdate, RealTimeUpdate
+from kirin.core.model import TripUpdate, RealTimeUpdate, EntityFingerprint
 from kirin.utils import should_retry_exception, make_kirin_lock_name, get_lock
 from kirin.gtfs_rt.gtfs_rt import get_gtfsrt_contributors
 from kirin.cots.cots import get_cots_contributor
@@ -83,8 +83,16 @@ def purge_trip_update(self, config):
         until = datetime.date.today() - datetime.timedelta(days=int(config["nb_days_to_keep"]))
         logger.info("purge trip update for {} until {}".format(contributor, until))
 
-        TripUpdate.remove_by_contributors_and_period(contributors=[contributor], start_date=None, end_date=until)
-        logger.info("%s for %s is finished", func_name, contributor)
+        nb_removed = TripUpdate.remove_by_contributors_and_period(
+            contributors=[contributor],
+            start_date=None,
+            end_date=until,
+            batch_size=app.config[str("PURGE_TRIP_UPDATE_BATCH_SIZE")],
+            time_budget=app.config[str("PURGE_TRIP_UPDATE_TIME_BUDGET")],
+        )
+        logger.info("%s for %s is finished: %s trip_updates removed", func_name, contributor, nb_removed)
+
+        EntityFingerprint.remove_by_contributor_until(contributor, until)
 
 
 @celery.task(bind=True)
@@ -111,19 +119,15 @@ def purge_rt_update(self, config):
 
 
 from kirin.gtfs_rt.tasks import gtfs_poller
+from kirin.gtfs_rt import polling
 
 
 @celery.task(bind=True)
 def poller(self):
-    for contributor in get_gtfsrt_contributors():
-        config = {
-            "contributor": contributor.id,
-            "navitia_url": app.config.get(str("NAVITIA_URL")),
-            "token": contributor.navitia_token,
-            "coverage": contributor.navitia_coverage,
-            "feed_url": contributor.feed_url,
-            "timeout": app.config.get(str("GTFS_RT_TIMEOUT"), 1),
-        }
+    if app.config.get(str("GTFS_RT_CONCURRENT_POLLER")):
+        # GTFS-RT feeds are polled by the poll_gtfs_rt command
+        return
+    for config in polling.get_polling_configs():
         gtfs_poller.delay(config)
 
 
@@ -32,7 +32,6 @@
 from __future__ import absolute_import, print_function, unicode_literals, division
 import logging
 
-import six
 from aniso8601 import parse_date
 from pythonjsonlogger import jsonlogger
 from flask.globals import current_app
@@ -43,7 +42,7 @@ from contextlib import contextmanager
 from kirin.core import model
 from kirin.core.model import RealTimeUpdate
 from kirin.exceptions import InternalException
-import requests
+from kirin.http_sessions import get_session
 
 
 def floor_datetime(datetime):
@@ -122,6 +121,52 @@ def record_call(status, **kwargs):
     new_relic.record_custom_event("kirin_status", params)
 
 
+def call_concurrently(func, args_list):
+    """
+    Call func on each (distinct) tuple of arguments of args_list, with at most NAVITIA_QUERY_POOL_SIZE calls
+    running at the same time (in greenlets when USE_GEVENT, in threads otherwise, one by one if it's below 2).
+    Meant to prefetch navitia requests: calls raising an exception are logged and left out of the result
+    (they are to be done again, and fail properly, when their result is needed).
+
+    :return: dict of the results by tuple of arguments
+    """
+    args_list = list(set(args_list))
+    pool_size = min(current_app.config.get(str("NAVITIA_QUERY_POOL_SIZE"), 1), len(args_list))
+    failed = object()
+
+    def call(args):
+        try:
+            return args, func(*args)
+        except Exception as e:
+            logging.getLogger(__name__).warning("call of {} failed: {}".format(args, e))
+            return args, failed
+
+    if pool_size < 2:
+        results = [call(args) for args in args_list]
+    else:
+        app = current_app._get_current_object()
+
+        def call_in_app_context(args):
+            # each greenlet/thread has its own app context (and db session)
+            with app.app_context():
+                return call(args)
+
+        if app.config.get(str("USE_GEVENT")):
+            from gevent.pool import Pool
+
+            results = Pool(pool_size).map(call_in_app_context, args_list)
+        else:
+            from multiprocessing.pool import ThreadPool
+
+            pool = ThreadPool(pool_size)
+            try:
+                results = pool.map(call_in_app_context, args_list)
+            finally:
+                pool.close()
+                pool.join()  # worker threads are not left behind, a pool is made for each call
+    return {args: res for args, res in results if res is not failed}
+
+
 def should_retry_exception(exception):
     return isinstance(exception, ConnectionError)
 
@@ -137,11 +182,42 @@ def build_redis_etag_key(contributor):
     return "|".join([contributor, "polling_HEAD"])
 
 
+def build_redis_last_modified_key(contributor):
+    # type: (unicode) -> unicode
+    return "|".join([contributor, "polling_Last-Modified"])
+
+
+def build_redis_feed_digest_key(contributor):
+    # type: (unicode) -> unicode
+    return "|".join([contributor, "polling_digest"])
+
+
+def build_redis_feed_timestamp_key(contributor):
+    # type: (unicode) -> unicode
+    return "|".join([contributor, "polling_timestamp"])
+
+
+def build_redis_polling_state_key(contributor):
+    # type: (unicode) -> unicode
+    return "|".join([contributor, "polling_state"])
+
+
+def build_redis_pending_feed_key(contributor):
+    # type: (unicode) -> unicode
+    return "|".join([contributor, "polling_pending_feed"])
+
+
 def allow_reprocess_same_data(contributor):
     # type: (unicode) -> None
     from kirin import redis_client
 
-    redis_client.delete(build_redis_etag_key(contributor))  # wipe previous' ETag memory
+    # wipe previous' feed memory (ETag, Last-Modified, digest and timestamp)
+    redis_client.delete(
+        build_redis_etag_key(contributor),
+        build_redis_last_modified_key(contributor),
+        build_redis_feed_digest_key(contributor),
+        build_redis_feed_timestamp_key(contributor),
+    )
 
 
 def set_rtu_status_ko(rtu, error, is_reprocess_same_data_allowed):
@@ -171,8 +247,7 @@ def save_rt_data_with_error(data, connector, contributor, error, is_reprocess_sa
     :param is_reprocess_same_data_allowed: If the same input is provided next time, should we
     reprocess it (hoping a happier ending)
     """
-    raw_data = six.binary_type(data)
-    rt_update = make_rt_update(raw_data, connector=connector, contributor=contributor)
+    rt_update = make_rt_update(data, connector=connector, contributor=contributor)
     set_rtu_status_ko(rt_update, error, is_reprocess_same_data_allowed)
     model.db.session.add(rt_update)
     model.db.session.commit()
@@ -197,12 +272,13 @@ def manage_db_error(data, connector, contributor, error, is_reprocess_same_data_
     This way, we know we had this error between created_at and updated_at, but we don't get extra rows in db
 
     Otherwise, we create a new one, as we want to track error changes
+    (data is compared through its digest, data of the last RTUpdate is not loaded)
 
     :param is_reprocess_same_data_allowed: If the same input is provided next time, should we
     reprocess it (hoping a happier ending)
     """
     last = model.RealTimeUpdate.get_last_rtu(connector, contributor)
-    if last and last.status == "KO" and last.error == error and last.raw_data == six.binary_type(data):
+    if last and last.status == "KO" and last.error == error and last.has_raw_data(data):
         poke_updated_at(last)
         if is_reprocess_same_data_allowed:
             allow_reprocess_same_data(contributor)
@@ -217,7 +293,8 @@ def manage_db_no_new(connector, contributor):
 
 def can_connect_to_navitia():
     try:
-        response = requests.head(current_app.config[str("NAVITIA_URL")])
+        navitia_url = current_app.config[str("NAVITIA_URL")]
+        response = get_session(navitia_url).head(navitia_url)
         return response.status_code == 200
     except Exception:
         return False
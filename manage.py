@@ -37,6 +37,8 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from kirin import manager
 import kirin.command.purge_rt
+import kirin.command.show_rt
+import kirin.command.poll_gtfs_rt
 
 migrate = Migrate(app, db)
 manager.add_command("db", MigrateCommand)
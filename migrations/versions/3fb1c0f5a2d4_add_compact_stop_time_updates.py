@@ -0,0 +1,26 @@
+"""
+Add column compact_stop_time_updates in trip_update
+to optionally store stop_times of a trip as a jsonb array instead of rows of stop_time_update
+
+Revision ID: 3fb1c0f5a2d4
+Revises: 57860080e5d6
+Create Date: 2026-10-18 10:12:41.381072
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "3fb1c0f5a2d4"
+down_revision = "57860080e5d6"
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.add_column("trip_update", sa.Column("compact_stop_time_updates", postgresql.JSONB(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("trip_update", "compact_stop_time_updates")
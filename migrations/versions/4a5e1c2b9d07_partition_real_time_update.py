@@ -0,0 +1,98 @@
+"""
+Partition real_time_update by day of created_at
+
+Each day of real_time_update lives in its own child table 'real_time_update_YYYYMMDD' inheriting
+from real_time_update, created on the fly by the insert trigger of real_time_update.
+Purge can then drop whole partitions instead of deleting rows.
+Rows already in real_time_update stay in the parent table, they are purged row by row as before.
+
+As a foreign key cannot reference rows of child tables, the foreign key from
+associate_realtimeupdate_tripupdate to real_time_update is dropped.
+
+Revision ID: 4a5e1c2b9d07
+Revises: 3fb1c0f5a2d4
+Create Date: 2026-10-18 14:05:22.518734
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "4a5e1c2b9d07"
+down_revision = "3fb1c0f5a2d4"
+
+from alembic import op
+
+
+def upgrade():
+    op.execute(
+        "ALTER TABLE public.associate_realtimeupdate_tripupdate"
+        "    DROP CONSTRAINT associate_realtimeupdate_tripupdate_real_time_update_id_fkey"
+    )
+    op.execute(
+        """
+        CREATE FUNCTION real_time_update_create_partition(day DATE) RETURNS TEXT AS $$
+        DECLARE
+            partition TEXT := 'real_time_update_' || to_char(day, 'YYYYMMDD');
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relname = partition AND relkind = 'r') THEN
+                -- indexes and primary key are copied from real_time_update, foreign keys have to be added
+                EXECUTE format('CREATE TABLE %I (LIKE real_time_update INCLUDING DEFAULTS INCLUDING CONSTRAINTS'
+                               '    INCLUDING INDEXES) INHERITS (real_time_update)', partition);
+                EXECUTE format('ALTER TABLE %I ADD FOREIGN KEY (contributor_id) REFERENCES contributor(id)',
+                               partition);
+            END IF;
+            RETURN partition;
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN
+            -- partition created by a concurrent transaction
+            RETURN partition;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION real_time_update_insert() RETURNS TRIGGER AS $$
+        BEGIN
+            EXECUTE format('INSERT INTO %I SELECT ($1).*', real_time_update_create_partition(NEW.created_at::DATE))
+                USING NEW;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        "CREATE TRIGGER real_time_update_partition BEFORE INSERT ON real_time_update"
+        "    FOR EACH ROW EXECUTE PROCEDURE real_time_update_insert()"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER real_time_update_partition ON real_time_update")
+    # move rows of every partition back into real_time_update
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            p RECORD;
+        BEGIN
+            FOR p IN SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                     WHERE i.inhparent = 'real_time_update'::REGCLASS LOOP
+                EXECUTE format('ALTER TABLE %I NO INHERIT real_time_update', p.relname);
+                EXECUTE format('INSERT INTO real_time_update SELECT * FROM %I', p.relname);
+                EXECUTE format('DROP TABLE %I', p.relname);
+            END LOOP;
+        END;
+        $$;
+        """
+    )
+    op.execute("DROP FUNCTION real_time_update_insert()")
+    op.execute("DROP FUNCTION real_time_update_create_partition(DATE)")
+    op.execute(
+        "DELETE FROM associate_realtimeupdate_tripupdate art"
+        "    WHERE NOT EXISTS (SELECT 1 FROM real_time_update rtu WHERE rtu.id = art.real_time_update_id)"
+    )
+    op.execute(
+        "ALTER TABLE public.associate_realtimeupdate_tripupdate"
+        "    ADD CONSTRAINT associate_realtimeupdate_tripupdate_real_time_update_id_fkey"
+        "        FOREIGN KEY (real_time_update_id) REFERENCES real_time_update(id) ON DELETE CASCADE"
+    )
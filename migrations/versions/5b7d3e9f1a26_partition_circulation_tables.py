@@ -0,0 +1,162 @@
+"""
+Partition vehicle_journey, trip_update and stop_time_update by day of the vehicle journey's start_timestamp
+
+Each circulation day lives in child tables 'vehicle_journey_YYYYMMDD', 'trip_update_YYYYMMDD' and
+'stop_time_update_YYYYMMDD' inheriting from their table, created on the fly by the insert trigger of
+vehicle_journey (trip_update and stop_time_update rows follow their vehicle_journey).
+vehicle_journey partitions have a CHECK constraint on start_timestamp, so that queries filtering on it only
+scan the matching days. Foreign keys (with their ON DELETE CASCADE) are declared between the partitions of
+a same day, purge can then drop whole days.
+
+The foreign key from associate_realtimeupdate_tripupdate to trip_update is dropped (it cannot reference
+rows of child tables), association rows are removed with their trip_update by TripUpdate's purge.
+
+Revision ID: 5b7d3e9f1a26
+Revises: 4a5e1c2b9d07
+Create Date: 2026-10-18 16:41:03.972105
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "5b7d3e9f1a26"
+down_revision = "4a5e1c2b9d07"
+
+from alembic import op
+
+
+def upgrade():
+    op.execute(
+        "ALTER TABLE public.associate_realtimeupdate_tripupdate"
+        "    DROP CONSTRAINT associate_realtimeupdate_tripupdate_trip_update_id_fkey"
+    )
+    op.execute("ALTER TABLE public.trip_update DROP CONSTRAINT trip_update_vj_id_fkey")
+    op.execute("ALTER TABLE public.stop_time_update DROP CONSTRAINT stop_time_update_trip_update_id_fkey")
+    op.create_index(
+        "associate_realtimeupdate_tripupdate_trip_update_id_idx",
+        "associate_realtimeupdate_tripupdate",
+        ["trip_update_id"],
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION circulation_create_partitions(day DATE) RETURNS VOID AS $$
+        DECLARE
+            suffix TEXT := to_char(day, 'YYYYMMDD');
+        BEGIN
+            -- indexes and primary keys are copied from parent tables, foreign keys have to be added
+            EXECUTE format('CREATE TABLE %I (LIKE vehicle_journey INCLUDING DEFAULTS INCLUDING CONSTRAINTS'
+                           '    INCLUDING INDEXES, CHECK (start_timestamp >= %L AND start_timestamp < %L))'
+                           '    INHERITS (vehicle_journey)', 'vehicle_journey_' || suffix, day, day + 1);
+            EXECUTE format('CREATE TABLE %I (LIKE trip_update INCLUDING DEFAULTS INCLUDING CONSTRAINTS'
+                           '    INCLUDING INDEXES, FOREIGN KEY (vj_id) REFERENCES %I(id) ON DELETE CASCADE,'
+                           '    FOREIGN KEY (contributor_id) REFERENCES contributor(id)) INHERITS (trip_update)',
+                           'trip_update_' || suffix, 'vehicle_journey_' || suffix);
+            EXECUTE format('CREATE TABLE %I (LIKE stop_time_update INCLUDING DEFAULTS INCLUDING CONSTRAINTS'
+                           '    INCLUDING INDEXES, FOREIGN KEY (trip_update_id) REFERENCES %I(vj_id)'
+                           '    ON DELETE CASCADE) INHERITS (stop_time_update)',
+                           'stop_time_update_' || suffix, 'trip_update_' || suffix);
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN
+            -- partitions created by a concurrent transaction
+            RETURN;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION vehicle_journey_insert() RETURNS TRIGGER AS $$
+        DECLARE
+            partition TEXT := 'vehicle_journey_' || to_char(NEW.start_timestamp, 'YYYYMMDD');
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relname = partition AND relkind = 'r') THEN
+                PERFORM circulation_create_partitions(NEW.start_timestamp::DATE);
+            END IF;
+            EXECUTE format('INSERT INTO %I SELECT ($1).*', partition) USING NEW;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    # trip_update and stop_time_update go in the partition of the vehicle_journey
+    # (trip_update.vj_id and stop_time_update.trip_update_id are both the id of the vehicle_journey)
+    for table, vj_id_column in [("trip_update", "vj_id"), ("stop_time_update", "trip_update_id")]:
+        op.execute(
+            """
+            CREATE FUNCTION {table}_insert() RETURNS TRIGGER AS $$
+            DECLARE
+                vj_start TIMESTAMP := (SELECT vj.start_timestamp FROM vehicle_journey vj
+                                       WHERE vj.id = NEW.{vj_id_column});
+            BEGIN
+                IF vj_start IS NULL THEN
+                    RAISE EXCEPTION 'no vehicle_journey % for {table}', NEW.{vj_id_column}
+                        USING ERRCODE = 'foreign_key_violation';
+                END IF;
+                EXECUTE format('INSERT INTO %I SELECT ($1).*', '{table}_' || to_char(vj_start, 'YYYYMMDD'))
+                    USING NEW;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """.format(
+                table=table, vj_id_column=vj_id_column
+            )
+        )
+    for table in ["vehicle_journey", "trip_update", "stop_time_update"]:
+        op.execute(
+            "CREATE TRIGGER {table}_partition BEFORE INSERT ON {table}"
+            "    FOR EACH ROW EXECUTE PROCEDURE {table}_insert()".format(table=table)
+        )
+        # move existing rows into partitions
+        op.execute(
+            "WITH moved AS (DELETE FROM ONLY {table} RETURNING *)"
+            "    INSERT INTO {table} SELECT * FROM moved".format(table=table)
+        )
+
+
+def downgrade():
+    for table in ["vehicle_journey", "trip_update", "stop_time_update"]:
+        op.execute("DROP TRIGGER {table}_partition ON {table}".format(table=table))
+        op.execute("DROP FUNCTION {table}_insert()".format(table=table))
+    op.execute("DROP FUNCTION circulation_create_partitions(DATE)")
+    # move rows of every partition back into its parent table
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            p RECORD;
+        BEGIN
+            FOR p IN SELECT c.relname, i.inhparent::REGCLASS::TEXT AS parent
+                     FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                     WHERE i.inhparent IN ('vehicle_journey'::REGCLASS, 'trip_update'::REGCLASS,
+                                           'stop_time_update'::REGCLASS) LOOP
+                EXECUTE format('ALTER TABLE %I NO INHERIT %I', p.relname, p.parent);
+                EXECUTE format('INSERT INTO %I SELECT * FROM %I', p.parent, p.relname);
+                EXECUTE format('DROP TABLE %I CASCADE', p.relname);
+            END LOOP;
+        END;
+        $$;
+        """
+    )
+    op.drop_index(
+        "associate_realtimeupdate_tripupdate_trip_update_id_idx",
+        table_name="associate_realtimeupdate_tripupdate",
+    )
+    op.execute(
+        "DELETE FROM associate_realtimeupdate_tripupdate art"
+        "    WHERE NOT EXISTS (SELECT 1 FROM trip_update tu WHERE tu.vj_id = art.trip_update_id)"
+    )
+    op.execute(
+        "ALTER TABLE public.stop_time_update"
+        "    ADD CONSTRAINT stop_time_update_trip_update_id_fkey"
+        "        FOREIGN KEY (trip_update_id) REFERENCES trip_update(vj_id) ON DELETE CASCADE"
+    )
+    op.execute(
+        "ALTER TABLE public.trip_update"
+        "    ADD CONSTRAINT trip_update_vj_id_fkey"
+        "        FOREIGN KEY (vj_id) REFERENCES vehicle_journey(id) ON DELETE CASCADE"
+    )
+    op.execute(
+        "ALTER TABLE public.associate_realtimeupdate_tripupdate"
+        "    ADD CONSTRAINT associate_realtimeupdate_tripupdate_trip_update_id_fkey"
+        "        FOREIGN KEY (trip_update_id) REFERENCES trip_update(vj_id) ON DELETE CASCADE"
+    )
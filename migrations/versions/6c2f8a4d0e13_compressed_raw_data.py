@@ -0,0 +1,161 @@
+"""
+Store raw input of real_time_update compressed in table raw_data, shared by real_time_updates of same content
+
+Real_time_updates only reference their raw_data by the sha256 of its content (real_time_update.raw_data_hash).
+Raw inputs of real_time_updates saved before are moved from column real_time_update.raw_data (kept empty for
+the downgrade) to table raw_data, by batches.
+
+Revision ID: 6c2f8a4d0e13
+Revises: 5b7d3e9f1a26
+Create Date: 2026-10-18 18:22:47.130586
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "6c2f8a4d0e13"
+down_revision = "5b7d3e9f1a26"
+
+from alembic import op
+from google.protobuf import text_format
+from google.protobuf.message import DecodeError
+import hashlib
+import six
+import sqlalchemy as sa
+import zlib
+
+from kirin import gtfs_realtime_pb2
+
+BATCH_SIZE = 1000
+
+
+def _batches(connection, query):
+    """
+    Iterate over the rows of query by batches of BATCH_SIZE rows, in real_time_update's id order
+    :param query: selects the id of the real_time_update first, filters on "rtu.id > CAST(:last_id AS UUID)",
+        is ordered by rtu.id and limited to :batch_size rows
+    """
+    last_id = "00000000-0000-0000-0000-000000000000"
+    while True:
+        rows = connection.execute(sa.text(query), last_id=last_id, batch_size=BATCH_SIZE).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.create_table(
+        "raw_data",
+        sa.Column("hash", sa.Text(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+    op.create_index("raw_data_created_at_idx", "raw_data", ["created_at"])
+    # the new column is added to every partition, partitions created later copy the index
+    op.add_column("real_time_update", sa.Column("raw_data_hash", sa.Text(), nullable=True))
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            p RECORD;
+        BEGIN
+            FOR p IN SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                     WHERE i.inhparent = 'real_time_update'::REGCLASS LOOP
+                EXECUTE format('CREATE INDEX %I ON %I (raw_data_hash)',
+                               p.relname || '_raw_data_hash_idx', p.relname);
+            END LOOP;
+        END;
+        $$;
+        """
+    )
+    op.create_index("realtime_update_raw_data_hash_idx", "real_time_update", ["raw_data_hash"])
+
+    connection = op.get_bind()
+    insert_raw_data = sa.text(
+        "INSERT INTO raw_data (hash, data, created_at) SELECT :hash, :data, :created_at"
+        "    WHERE NOT EXISTS (SELECT 1 FROM raw_data WHERE hash = :hash)"
+    ).bindparams(sa.bindparam("data", type_=sa.LargeBinary))
+    for rows in _batches(
+        connection,
+        "SELECT rtu.id, rtu.raw_data, rtu.created_at FROM real_time_update rtu"
+        "    WHERE rtu.id > CAST(:last_id AS UUID) AND rtu.raw_data IS NOT NULL"
+        "    ORDER BY rtu.id LIMIT :batch_size",
+    ):
+        raw_data_by_hash = {}
+        rtu_hashes = []
+        for rtu_id, raw_data, created_at in rows:
+            data = raw_data.encode("utf-8")
+            raw_hash = hashlib.sha256(data).hexdigest()
+            raw = raw_data_by_hash.setdefault(
+                raw_hash, {"hash": raw_hash, "data": data, "created_at": created_at}
+            )
+            raw["created_at"] = max(raw["created_at"], created_at)  # created_at of a raw_data is its last use
+            rtu_hashes.append({"id": rtu_id, "hash": raw_hash})
+        for raw in raw_data_by_hash.values():
+            raw["data"] = zlib.compress(raw["data"])
+        connection.execute(
+            sa.text("UPDATE raw_data SET created_at = GREATEST(created_at, :created_at) WHERE hash = :hash"),
+            list(raw_data_by_hash.values()),
+        )
+        connection.execute(insert_raw_data, list(raw_data_by_hash.values()))
+        connection.execute(
+            sa.text("UPDATE real_time_update SET raw_data_hash = :hash, raw_data = NULL WHERE id = :id"),
+            rtu_hashes,
+        )
+
+
+def _is_text_feed(text):
+    """
+    :return: True if text is a GTFS-RT feed in protobuf text format
+    """
+    try:
+        text_format.Merge(text, gtfs_realtime_pb2.FeedMessage())
+        return True
+    except text_format.ParseError:
+        return False
+
+
+def _to_text(connector, data):
+    """
+    :return: raw input as stored in the text column real_time_update.raw_data before this revision
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = None
+    if connector == "gtfs-rt" and not (text is not None and _is_text_feed(text)):
+        # binary GTFS-RT feeds (the ones moved by upgrade are still text) were stored in protobuf text format
+        proto = gtfs_realtime_pb2.FeedMessage()
+        try:
+            proto.ParseFromString(data)
+            return six.text_type(text_format.MessageToString(proto))
+        except DecodeError:
+            pass
+    if text is None:
+        raise Exception("raw input of a {} real_time_update can't be stored as text".format(connector))
+    return text
+
+
+def downgrade():
+    # put back uncompressed raw input in real_time_update (a text column).
+    # The migration runs in a transaction: a raw input that can't be converted rolls the whole downgrade back
+    connection = op.get_bind()
+    for rows in _batches(
+        connection,
+        "SELECT rtu.id, rtu.connector, rd.data FROM real_time_update rtu"
+        "    JOIN raw_data rd ON rd.hash = rtu.raw_data_hash"
+        "    WHERE rtu.id > CAST(:last_id AS UUID) ORDER BY rtu.id LIMIT :batch_size",
+    ):
+        connection.execute(
+            sa.text("UPDATE real_time_update SET raw_data = :raw_data WHERE id = :id"),
+            [
+                {"id": rtu_id, "raw_data": _to_text(connector, zlib.decompress(data))}
+                for rtu_id, connector, data in rows
+            ],
+        )
+    op.drop_index("realtime_update_raw_data_hash_idx", table_name="real_time_update")
+    op.drop_column("real_time_update", "raw_data_hash")
+    op.drop_index("raw_data_created_at_idx", table_name="raw_data")
+    op.drop_table("raw_data")
@@ -0,0 +1,33 @@
+"""
+Add table entity_fingerprint, to skip unchanged entities of GTFS-RT feeds
+
+Revision ID: 7d4a1b6e2c58
+Revises: 6c2f8a4d0e13
+Create Date: 2026-10-18 20:03:15.224970
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "7d4a1b6e2c58"
+down_revision = "6c2f8a4d0e13"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        "entity_fingerprint",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("contributor_id", sa.Text(), nullable=False),
+        sa.Column("entity_key", sa.Text(), nullable=False),
+        sa.Column("fingerprint", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(["contributor_id"], ["contributor.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("contributor_id", "entity_key"),
+    )
+
+
+def downgrade():
+    op.drop_table("entity_fingerprint")
@@ -0,0 +1,26 @@
+"""
+Add min_polling_interval and max_polling_interval to contributor, bounding its adaptive polling
+
+Revision ID: 8e3b5c7f9a14
+Revises: 7d4a1b6e2c58
+Create Date: 2026-10-18 22:12:47.301846
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "8e3b5c7f9a14"
+down_revision = "7d4a1b6e2c58"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column("contributor", sa.Column("min_polling_interval", sa.Integer(), nullable=True))
+    op.add_column("contributor", sa.Column("max_polling_interval", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("contributor", "max_polling_interval")
+    op.drop_column("contributor", "min_polling_interval")
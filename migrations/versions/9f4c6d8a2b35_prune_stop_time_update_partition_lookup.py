@@ -0,0 +1,73 @@
+"""
+Look up the vehicle_journey of an inserted stop_time_update only in the partitions of the days around its
+(base) stop time, instead of probing every vehicle_journey partition for each row
+
+The CHECK constraints of the vehicle_journey partitions let the planner exclude the other days, as the
+bounds are inlined in the query. Every partition is still looked up if the stop_time_update has no time or
+its vehicle_journey is not found around it.
+
+Revision ID: 9f4c6d8a2b35
+Revises: 8e3b5c7f9a14
+Create Date: 2026-10-19 09:37:21.508146
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals, division
+
+# revision identifiers, used by Alembic.
+revision = "9f4c6d8a2b35"
+down_revision = "8e3b5c7f9a14"
+
+from alembic import op
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION stop_time_update_insert() RETURNS TRIGGER AS $$
+        DECLARE
+            -- base (without delay) time of the stop, a vehicle_journey starts at most 2 days before it
+            base_time TIMESTAMP := coalesce(NEW.departure - coalesce(NEW.departure_delay, INTERVAL '0'),
+                                            NEW.arrival - coalesce(NEW.arrival_delay, INTERVAL '0'));
+            vj_start TIMESTAMP;
+        BEGIN
+            IF base_time IS NOT NULL THEN
+                EXECUTE format('SELECT vj.start_timestamp FROM vehicle_journey vj WHERE vj.id = %L'
+                               '    AND vj.start_timestamp >= %L AND vj.start_timestamp < %L',
+                               NEW.trip_update_id, base_time::DATE - 2, base_time::DATE + 2)
+                    INTO vj_start;
+            END IF;
+            IF vj_start IS NULL THEN
+                vj_start := (SELECT vj.start_timestamp FROM vehicle_journey vj WHERE vj.id = NEW.trip_update_id);
+            END IF;
+            IF vj_start IS NULL THEN
+                RAISE EXCEPTION 'no vehicle_journey % for stop_time_update', NEW.trip_update_id
+                    USING ERRCODE = 'foreign_key_violation';
+            END IF;
+            EXECUTE format('INSERT INTO %I SELECT ($1).*', 'stop_time_update_' || to_char(vj_start, 'YYYYMMDD'))
+                USING NEW;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION stop_time_update_insert() RETURNS TRIGGER AS $$
+        DECLARE
+            vj_start TIMESTAMP := (SELECT vj.start_timestamp FROM vehicle_journey vj
+                                   WHERE vj.id = NEW.trip_update_id);
+        BEGIN
+            IF vj_start IS NULL THEN
+                RAISE EXCEPTION 'no vehicle_journey % for stop_time_update', NEW.trip_update_id
+                    USING ERRCODE = 'foreign_key_violation';
+            END IF;
+            EXECUTE format('INSERT INTO %I SELECT ($1).*', 'stop_time_update_' || to_char(vj_start, 'YYYYMMDD'))
+                USING NEW;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
@@ -35,6 +35,7 @@ import six
 
 from kirin import app, db
 from kirin.core import model
+from kirin.cots import referential
 import pytest
 import flask_migrate
 
@@ -90,6 +91,14 @@ def clean_db():
         db.session.commit()
 
 
+@pytest.fixture(scope="function", autouse=True)
+def clean_cots_referential(monkeypatch):
+    """
+    navitia objects looked up by COTS messages are not kept from one test to another
+    """
+    monkeypatch.setattr(referential, "_referentials", {})
+
+
 @pytest.fixture(scope="function")
 def mock_navitia_fixture(monkeypatch):
     from .. import mock_navitia
@@ -98,3 +107,6 @@ def mock_navitia_fixture(monkeypatch):
     Mock all calls to navitia for this fixture
     """
     monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.query", mock_navitia.mock_navitia_query)
+    monkeypatch.setattr(
+        "navitia_wrapper._NavitiaWrapper.get_publication_date", mock_navitia.mock_publication_date
+    )
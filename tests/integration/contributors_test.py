@@ -201,6 +201,20 @@ def test_post_contributor_with_wrong_connector_type_should_fail(test_client):
     assert resp.status_code == 400
 
 
+def test_post_contributor_with_min_polling_interval_greater_than_max_should_fail(test_client):
+    resp = test_client.post(
+        "/contributors",
+        json={
+            "id": "realtime.tokyo",
+            "navitia_coverage": "jp",
+            "connector_type": "gtfs-rt",
+            "min_polling_interval": 60,
+            "max_polling_interval": 30,
+        },
+    )
+    assert resp.status_code == 400
+
+
 def test_post_new_valid_contributor_with_unknown_parameter_should_work(test_client):
     resp = test_client.post(
         "/contributors",
@@ -296,6 +310,21 @@ def test_put_unknown_contributor(test_client, with_custom_contributors):
 def test_put_contributor_with_malformed_data(test_client, with_custom_contributors):
     resp = test_client.put("/contributors/realtime.paris", json={"feed_url": 42})
     assert resp.status_code == 400
+    resp = test_client.put("/contributors/realtime.paris", json={"min_polling_interval": 0})
+    assert resp.status_code == 400
+    resp = test_client.put(
+        "/contributors/realtime.paris", json={"min_polling_interval": 60, "max_polling_interval": 30}
+    )
+    assert resp.status_code == 400
+
+
+def test_put_contributor_min_polling_interval_greater_than_existing_max(test_client, with_custom_contributors):
+    resp = test_client.put("/contributors/realtime.paris", json={"max_polling_interval": 30})
+    assert resp.status_code == 200
+    resp = test_client.put("/contributors/realtime.paris", json={"min_polling_interval": 60})
+    assert resp.status_code == 400
+    contrib = json.loads(test_client.get("/contributors/realtime.paris").data)["contributors"][0]
+    assert contrib["min_polling_interval"] is None
 
 
 def test_post_get_put_to_ensure_API_consitency(test_client):
@@ -306,6 +335,8 @@ def test_post_get_put_to_ensure_API_consitency(test_client):
         "feed_url": "http://nihongo.jp",
         "connector_type": "gtfs-rt",
         "is_active": True,
+        "min_polling_interval": 5,
+        "max_polling_interval": 120,
     }
     test_client.post("/contributors", json=new_contrib)
 
@@ -35,6 +35,8 @@ from kirin import db, app
 from kirin.core import handle
 from kirin.cots import KirinModelBuilder, model_maker
 from kirin.utils import make_rt_update
+from tests import mock_navitia
+from tests.mock_navitia import companies
 from tests.check_utils import get_fixture_data, dumb_nav_wrapper
 from tests.integration.utils_cots_test import requests_mock_cause_message
 from tests.integration.conftest import clean_db, COTS_CONTRIBUTOR
@@ -115,6 +117,139 @@ def test_cots_train_delayed(mock_navitia_fixture):
         assert st.message == "Affluence exceptionnelle de voyageurs"
 
 
+def test_cots_navitia_vjs_cached_until_publication(monkeypatch, mock_navitia_fixture):
+    """
+    the navitia vehicle journeys of a train are searched once for all its messages,
+    until navitia data is published again
+    """
+    headsigns_searched = []
+
+    def query(self, query, q=None):
+        if query.startswith("vehicle_journeys"):
+            headsigns_searched.append(q["headsign"])
+        return mock_navitia.mock_navitia_query(self, query, q)
+
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.query", query)
+    # publication dates not used by other tests, for the cache to be empty
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.get_publication_date", lambda self: "20991115T000000")
+
+    input_train_delayed = get_fixture_data("cots_train_96231_delayed.json")
+    with app.app_context():
+        for _ in range(2):
+            rt_update = make_rt_update(input_train_delayed, connector="cots", contributor=COTS_CONTRIBUTOR)
+            KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR).build(rt_update)
+        assert headsigns_searched == ["96231"]
+
+        monkeypatch.setattr(
+            "navitia_wrapper._NavitiaWrapper.get_publication_date", lambda self: "20991116T000000"
+        )
+        rt_update = make_rt_update(input_train_delayed, connector="cots", contributor=COTS_CONTRIBUTOR)
+        KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR).build(rt_update)
+        assert headsigns_searched == ["96231", "96231"]
+
+
+def test_cots_navitia_vjs_cache_timeout_read_at_call(monkeypatch, mock_navitia_fixture):
+    """
+    the timeout of the cache of navitia vehicle journeys can be changed at runtime
+    """
+    timeouts = []
+    cache_set = app.cache.set
+
+    def recording_cache_set(key, value, timeout=None):
+        timeouts.append(timeout)
+        return cache_set(key, value, timeout=timeout)
+
+    monkeypatch.setattr(app.cache, "set", recording_cache_set)
+    monkeypatch.setitem(app.config, str("NAVITIA_SNCF_VJ_CACHE_TIMEOUT"), 42)
+    # publication date not used by other tests, for the cache to be empty
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.get_publication_date", lambda self: "20991117T000000")
+
+    input_train_delayed = get_fixture_data("cots_train_96231_delayed.json")
+    with app.app_context():
+        rt_update = make_rt_update(input_train_delayed, connector="cots", contributor=COTS_CONTRIBUTOR)
+        KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR).build(rt_update)
+    assert 42 in timeouts
+
+
+def test_cots_publication_date_requested_on_first_need(monkeypatch, mock_navitia_fixture):
+    pub_date_requests = []
+
+    def get_publication_date(self):
+        pub_date_requests.append(self)
+        return mock_navitia.mock_publication_date(self)
+
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.get_publication_date", get_publication_date)
+
+    input_train_delayed = get_fixture_data("cots_train_96231_delayed.json")
+    with app.app_context():
+        builder = KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR)
+        assert pub_date_requests == []
+        rt_update = make_rt_update(input_train_delayed, connector="cots", contributor=COTS_CONTRIBUTOR)
+        builder.build(rt_update)
+    assert len(pub_date_requests) == 1
+
+
+def test_cots_referential_kept_for_all_messages(monkeypatch, mock_navitia_fixture):
+    """
+    the navitia company of a train is searched once for all its messages (until navitia data is published)
+    """
+    queries = []
+
+    def query(self, query, q=None):
+        queries.append(query)
+        return mock_navitia.mock_navitia_query(self, query, q)
+
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.query", query)
+
+    input_train_delayed = get_fixture_data("cots_train_96231_delayed.json")
+    with app.app_context():
+        for _ in range(2):
+            rt_update = make_rt_update(input_train_delayed, connector="cots", contributor=COTS_CONTRIBUTOR)
+            KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR).build(rt_update)
+    assert len([q for q in queries if q.startswith("companies")]) == 1
+
+
+def test_cots_referential_collection_listed_by_pages(monkeypatch, mock_navitia_fixture):
+    """
+    all the companies of navitia are listed, even when they don't fit in one page
+    """
+    navitia_companies = json.loads(companies.response.json_response)["companies"]
+    start_pages = []
+
+    def query(self, query, q=None):
+        if query.startswith("companies"):
+            start_page = int(q.get("start_page", "0"))
+            start_pages.append(start_page)
+            return {"companies": navitia_companies[start_page : start_page + 1]}, 200
+        return mock_navitia.mock_navitia_query(self, query, q)
+
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.query", query)
+    monkeypatch.setattr(model_maker, "REFERENTIAL_COLLECTION_COUNT", "1")
+
+    with app.app_context():
+        builder = KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR)
+        assert builder._get_navitia_company("OCETH") == "company:OCE:TH"
+    assert start_pages == [0, 1, 2]
+
+
+def test_cots_referential_missing_stop_point_searched_again(mock_navitia_fixture):
+    """
+    a stop point found is kept for all messages, not a missing one
+    """
+    found_key = ("_request_navitia_stop_point", ("87", "1", "BV"))
+    missing_key = ("_request_navitia_stop_point", ("87", "2", "BV"))
+    with app.app_context():
+        builder = KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR)
+        builder.referential_responses[found_key] = ({"id": "sp:1"}, None)
+        builder.referential_responses[missing_key] = (None, {"log": "No stop point found"})
+        assert missing_key in builder.referential_responses
+
+        next_builder = KirinModelBuilder(dumb_nav_wrapper(), contributor=COTS_CONTRIBUTOR)
+        assert next_builder.referential is builder.referential
+        assert found_key in next_builder.referential_responses
+        assert missing_key not in next_builder.referential_responses
+
+
 def test_cots_train_trip_removal(mock_navitia_fixture):
     """
     test the import of cots_train_6113_trip_removal.json
@@ -34,17 +34,29 @@ from copy import deepcopy
 from datetime import timedelta
 import datetime
 import pytest
-from kirin.core.model import RealTimeUpdate, db, TripUpdate, StopTimeUpdate, VehicleJourney
+from kirin.core.model import RealTimeUpdate, db, TripUpdate, StopTimeUpdate, VehicleJourney, EntityFingerprint
 from kirin.core.populate_pb import to_posix_time, convert_to_gtfsrt
 from kirin import gtfs_rt, redis_client
 from kirin.core.types import TripEffect
 from kirin.tasks import purge_trip_update, purge_rt_update
+from kirin.gtfs_rt.tasks import _retrieve_gtfsrt, _is_new_feed, InvalidFeed, gtfs_processor
+from kirin.gtfs_rt import polling, poller
 from tests import mock_navitia
 from tests.check_utils import dumb_nav_wrapper, api_post, api_get
 from kirin import gtfs_realtime_pb2, app
-from kirin.utils import save_rt_data_with_error, manage_db_error, build_redis_etag_key, make_rt_update
+from kirin.utils import (
+    save_rt_data_with_error,
+    manage_db_error,
+    build_redis_etag_key,
+    make_rt_update,
+    allow_reprocess_same_data,
+    build_redis_polling_state_key,
+    build_redis_pending_feed_key,
+    make_kirin_lock_name,
+)
 from tests.integration.conftest import GTFS_CONTRIBUTOR
 import time
+import requests_mock
 from sqlalchemy import desc
 
 
@@ -150,6 +162,7 @@ def test_wrong_gtfs_rt_post():
     with app.app_context():
         # Raw data is saved in db, even when an error occurred
         assert len(RealTimeUpdate.query.all()) == 1
+        assert RealTimeUpdate.query.first().raw_data == b"bob"
         assert len(TripUpdate.query.all()) == 0
         assert len(StopTimeUpdate.query.all()) == 0
 
@@ -259,6 +272,8 @@ def test_gtfs_rt_simple_delay(basic_gtfs_rt_data, mock_rabbitmq):
 
     with app.app_context():
         assert len(RealTimeUpdate.query.all()) == 1
+        # the protobuf is saved as received
+        assert RealTimeUpdate.query.first().raw_data == basic_gtfs_rt_data.SerializeToString()
         assert len(TripUpdate.query.all()) == 1
         assert len(StopTimeUpdate.query.all()) == 4
 
@@ -882,7 +897,7 @@ def test_gtfs_rt_partial_update_same_feed(partial_update_gtfs_rt_data_1):
             # since the second real_time_update is the same as the first one,
             # the second one won't have an effect on existing trip update,
             # so the length is 1
-            assert len(trip_update.real_time_updates) == 1
+            assert trip_update.real_time_updates.count() == 1
 
             if nb_rt_update == 2:
                 last_real_time_update = RealTimeUpdate.query.order_by(RealTimeUpdate.created_at.desc()).first()
@@ -903,6 +918,68 @@ def test_gtfs_rt_partial_update_same_feed(partial_update_gtfs_rt_data_1):
     check(nb_rt_update=2)
 
 
+def test_gtfs_rt_unchanged_entity_skipped(
+    monkeypatch, partial_update_gtfs_rt_data_1, partial_update_gtfs_rt_data_2
+):
+    """
+    An entity is only built when its content changed since it was last processed
+    """
+    navitia_queries = []
+
+    def mock_navitia_query(self, query, q=None):
+        navitia_queries.append(query)
+        return mock_navitia.mock_navitia_query(self, query, q)
+
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.query", mock_navitia_query)
+    tester = app.test_client()
+    nb_navitia_queries = []
+    for data in [partial_update_gtfs_rt_data_1, partial_update_gtfs_rt_data_1, partial_update_gtfs_rt_data_2]:
+        with app.app_context():
+            app.cache.clear()
+        resp = tester.post("/gtfs_rt/{}".format(GTFS_CONTRIBUTOR), data=data.SerializeToString())
+        assert resp.status_code == 200
+        nb_navitia_queries.append(len(navitia_queries))
+        del navitia_queries[:]
+
+    # the entity of the 2nd feed is skipped: its vehicle journey is not even searched in navitia
+    assert nb_navitia_queries[0] > 0
+    assert nb_navitia_queries[1] == 0
+    assert nb_navitia_queries[2] > 0
+
+    with app.app_context():
+        rtus = RealTimeUpdate.query.order_by(RealTimeUpdate.created_at).all()
+        assert [rtu.status for rtu in rtus] == ["OK", "KO", "OK"]
+        assert rtus[1].error == "No new information destined to navitia for this gtfs-rt"
+        assert TripUpdate.query.first().real_time_updates.count() == 2
+        fingerprints = EntityFingerprint.query.all()
+        assert len(fingerprints) == 1
+        assert fingerprints[0].contributor_id == GTFS_CONTRIBUTOR
+        assert fingerprints[0].updated_at  # updated by the 3rd feed
+
+
+def test_gtfs_rt_entity_fingerprints_not_saved(monkeypatch, partial_update_gtfs_rt_data_1):
+    """
+    A failure while saving the fingerprints of entities fails neither the handling nor the next ones
+    """
+    monkeypatch.setattr(
+        gtfs_rt.KirinModelBuilder,
+        "_make_entity_fingerprint",
+        lambda self, input_trip_update, input_data_time: (None, "fingerprint"),  # no key, can't be saved
+    )
+    tester = app.test_client()
+    for _ in range(2):
+        resp = tester.post(
+            "/gtfs_rt/{}".format(GTFS_CONTRIBUTOR), data=partial_update_gtfs_rt_data_1.SerializeToString()
+        )
+        assert resp.status_code == 200
+
+    with app.app_context():
+        assert RealTimeUpdate.query.count() == 2
+        assert RealTimeUpdate.query.order_by(RealTimeUpdate.created_at).first().status == "OK"
+        assert TripUpdate.query.count() == 1
+        assert EntityFingerprint.query.count() == 0
+
+
 def test_gtfs_rt_partial_update_diff_feed_1(partial_update_gtfs_rt_data_1, partial_update_gtfs_rt_data_2):
     """
     In this test, we will send the two different gtfs-rt
@@ -923,7 +1000,7 @@ def test_gtfs_rt_partial_update_diff_feed_1(partial_update_gtfs_rt_data_1, parti
         assert trip_update.stop_time_updates[1].arrival_delay.seconds == 60
         assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
         assert trip_update.stop_time_updates[3].arrival_delay.seconds == 0
-        assert len(trip_update.real_time_updates) == 1
+        assert trip_update.real_time_updates.count() == 1
 
     # Now we apply another gtfs-rt, the new gtfs-rt will be save into the db and
     # increments the nb of real_time_updates
@@ -941,7 +1018,7 @@ def test_gtfs_rt_partial_update_diff_feed_1(partial_update_gtfs_rt_data_1, parti
         assert trip_update.stop_time_updates[1].arrival_delay.seconds == 60
         assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
         assert trip_update.stop_time_updates[3].arrival_delay.seconds == 180
-        assert len(trip_update.real_time_updates) == 2
+        assert trip_update.real_time_updates.count() == 2
 
 
 def test_gtfs_rt_partial_update_diff_feed_2(partial_update_gtfs_rt_data_2, partial_update_gtfs_rt_data_3):
@@ -966,7 +1043,7 @@ def test_gtfs_rt_partial_update_diff_feed_2(partial_update_gtfs_rt_data_2, parti
         assert trip_update.stop_time_updates[1].arrival_delay.seconds == 60
         assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
         assert trip_update.stop_time_updates[3].arrival_delay.seconds == 180
-        assert len(trip_update.real_time_updates) == 1
+        assert trip_update.real_time_updates.count() == 1
 
     tester = app.test_client()
     resp = tester.post(
@@ -986,13 +1063,41 @@ def test_gtfs_rt_partial_update_diff_feed_2(partial_update_gtfs_rt_data_2, parti
                 assert trip_update.stop_time_updates[1].arrival_delay.seconds == 60
                 assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
                 assert trip_update.stop_time_updates[3].arrival_delay.seconds == 180
-                assert len(trip_update.real_time_updates) == 1
+                assert trip_update.real_time_updates.count() == 1
             else:
                 assert trip_update.stop_time_updates[0].arrival_delay.seconds == 60
                 assert trip_update.stop_time_updates[1].arrival_delay.seconds == 0
                 assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
                 assert trip_update.stop_time_updates[3].arrival_delay.seconds == 0
-                assert len(trip_update.real_time_updates) == 1
+                assert trip_update.real_time_updates.count() == 1
+
+
+def test_gtfs_rt_navitia_vjs_searched_by_batch(monkeypatch, partial_update_gtfs_rt_data_3):
+    """
+    vehicle journeys of all trips of a feed are searched in navitia with a single query
+    """
+    navitia_queries = []
+
+    def mock_navitia_query(self, query, q=None):
+        navitia_queries.append((query, q))
+        return mock_navitia.mock_navitia_query(self, query, q)
+
+    monkeypatch.setattr("navitia_wrapper._NavitiaWrapper.query", mock_navitia_query)
+    with app.app_context():
+        app.cache.clear()
+
+    tester = app.test_client()
+    resp = tester.post(
+        "/gtfs_rt/{}".format(GTFS_CONTRIBUTOR), data=partial_update_gtfs_rt_data_3.SerializeToString()
+    )
+    assert resp.status_code == 200
+
+    vj_queries = [q for query, q in navitia_queries if query.startswith("vehicle_journeys")]
+    assert len(vj_queries) == 1
+    assert vj_queries[0]["count"] == "4"
+    with app.app_context():
+        assert len(TripUpdate.query.all()) == 2
+        assert {tu.vj.navitia_trip_id for tu in TripUpdate.query.all()} == {"R:vj1", "R:vj2"}
 
 
 def test_gtfs_rt_partial_update_last_stop_back_normal(
@@ -1020,7 +1125,7 @@ def test_gtfs_rt_partial_update_last_stop_back_normal(
         assert trip_update.stop_time_updates[1].arrival_delay.seconds == 60
         assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
         assert trip_update.stop_time_updates[3].arrival_delay.seconds == 180
-        assert len(trip_update.real_time_updates) == 1
+        assert trip_update.real_time_updates.count() == 1
         assert trip_update.effect == TripEffect.SIGNIFICANT_DELAYS.name
 
     tester = app.test_client()
@@ -1045,7 +1150,7 @@ def test_gtfs_rt_partial_update_last_stop_back_normal(
 
         assert trip_update.stop_time_updates[2].arrival_delay.seconds == 0
         assert trip_update.stop_time_updates[3].arrival_delay.seconds == 0
-        assert len(trip_update.real_time_updates) == 2
+        assert trip_update.real_time_updates.count() == 2
 
         # check that effect matches the absence or presence of delay
         if all(stu.arrival_delay.seconds == 0 for stu in trip_update.stop_time_updates):
@@ -2056,3 +2161,142 @@ def test_gtfs_pass_midnight_negative_delay_utc_model_builder(pass_midnight_negat
 
         feed = convert_to_gtfsrt(trip_updates)
         assert feed.entity[0].trip_update.trip.start_date == "20120615"  # must be UTC start date
+
+
+def test_retrieve_gtfsrt_conditional_get():
+    """
+    the feed is retrieved with a conditional GET using the ETag of the last feed retrieved
+    """
+    feed_url = "http://gtfs-rt.provider.com/feed"
+    config = {"contributor": GTFS_CONTRIBUTOR, "feed_url": feed_url}
+    with app.app_context(), requests_mock.Mocker() as m:
+        redis_client.delete(build_redis_etag_key(GTFS_CONTRIBUTOR))
+        m.get(feed_url, content=b"feed_1", headers={"ETag": "firstETag"})
+        assert _retrieve_gtfsrt(config) == b"feed_1"
+        assert "If-None-Match" not in m.last_request.headers
+        assert redis_client.get(build_redis_etag_key(GTFS_CONTRIBUTOR)) == "firstETag"
+
+        m.get(feed_url, status_code=304)
+        assert _retrieve_gtfsrt(config) is None  # not modified
+        assert m.last_request.headers["If-None-Match"] == "firstETag"
+
+        default_max_size = app.config[str("GTFS_RT_MAX_FEED_SIZE")]
+        app.config[str("GTFS_RT_MAX_FEED_SIZE")] = 3
+        try:
+            m.get(feed_url, content=b"feed_2", headers={"ETag": "secondETag"})
+            with pytest.raises(InvalidFeed):
+                _retrieve_gtfsrt(config)
+        finally:
+            app.config[str("GTFS_RT_MAX_FEED_SIZE")] = default_max_size
+        assert redis_client.get(build_redis_etag_key(GTFS_CONTRIBUTOR)) == "firstETag"
+
+
+def test_is_new_feed(basic_gtfs_rt_data):
+    """
+    a feed identical to the last one processed, or older, is not new
+    """
+    allow_reprocess_same_data(GTFS_CONTRIBUTOR)
+    content = basic_gtfs_rt_data.SerializeToString()
+    assert _is_new_feed(GTFS_CONTRIBUTOR, basic_gtfs_rt_data, content)
+    assert not _is_new_feed(GTFS_CONTRIBUTOR, basic_gtfs_rt_data, content)  # identical
+
+    older_feed = deepcopy(basic_gtfs_rt_data)
+    older_feed.header.timestamp -= 60
+    assert not _is_new_feed(GTFS_CONTRIBUTOR, older_feed, older_feed.SerializeToString())  # stale
+
+    newer_feed = deepcopy(basic_gtfs_rt_data)
+    newer_feed.header.timestamp += 60
+    assert _is_new_feed(GTFS_CONTRIBUTOR, newer_feed, newer_feed.SerializeToString())
+
+    allow_reprocess_same_data(GTFS_CONTRIBUTOR)  # e.g. after an error while processing it
+    assert _is_new_feed(GTFS_CONTRIBUTOR, newer_feed, newer_feed.SerializeToString())
+
+
+def test_adaptive_polling_schedule():
+    """
+    a contributor is not polled again before the interval computed from its last polling
+    """
+    redis_client.delete(build_redis_polling_state_key(GTFS_CONTRIBUTOR))
+    assert polling.get_contributors_to_poll([GTFS_CONTRIBUTOR]) == {GTFS_CONTRIBUTOR}
+
+    polling.record_polling(GTFS_CONTRIBUTOR, polling.NEW, min_interval=10, max_interval=300, feed_timestamp=1000)
+    assert polling.get_contributors_to_poll([GTFS_CONTRIBUTOR]) == set()
+    polling.record_polling(GTFS_CONTRIBUTOR, polling.NEW, min_interval=10, max_interval=300, feed_timestamp=1030)
+    state = redis_client.hgetall(build_redis_polling_state_key(GTFS_CONTRIBUTOR))
+    assert float(state[b"period"]) == 30  # learnt from the feed timestamps
+    assert float(state[b"last_feed_timestamp"]) == 1030
+
+    polling.record_polling(GTFS_CONTRIBUTOR, polling.ERROR, min_interval=10, max_interval=300)
+    state = redis_client.hgetall(build_redis_polling_state_key(GTFS_CONTRIBUTOR))
+    assert float(state[b"nb_errors"]) == 1
+
+
+def test_concurrent_poller_dispatches_new_feeds(monkeypatch, basic_gtfs_rt_data):
+    """
+    the concurrent poller only dispatches the processing of new feeds,
+    and doesn't poll a contributor whose last feed is not processed yet
+    """
+    feed_url = "http://gtfs-rt.provider.com/feed"
+    config = {"contributor": GTFS_CONTRIBUTOR, "feed_url": feed_url}
+    pending_feed_key = build_redis_pending_feed_key(GTFS_CONTRIBUTOR)
+    dispatched = []
+    monkeypatch.setattr(poller.gtfs_processor, "delay", dispatched.append)
+    allow_reprocess_same_data(GTFS_CONTRIBUTOR)
+    redis_client.delete(pending_feed_key)
+    content = basic_gtfs_rt_data.SerializeToString()
+    with requests_mock.Mocker() as m:
+        m.get(feed_url, content=content)
+        poller.check_contributor(config)
+        assert dispatched == [config]
+        assert redis_client.get(pending_feed_key) == content
+
+        poller.check_contributor(config)  # last feed not processed yet
+        assert m.call_count == 1
+
+        redis_client.delete(pending_feed_key)  # feed processed
+        poller.check_contributor(config)  # same feed, not dispatched again
+        assert m.call_count == 2
+        assert len(dispatched) == 1
+
+
+def test_concurrent_poller_releases_lock_before_dispatch(monkeypatch, basic_gtfs_rt_data):
+    """
+    the processing of a new feed is dispatched once the lock of the contributor is released,
+    for the processing to take it
+    """
+    feed_url = "http://gtfs-rt.provider.com/feed"
+    config = {"contributor": GTFS_CONTRIBUTOR, "feed_url": feed_url}
+    lock_name = make_kirin_lock_name("gtfs_poller", GTFS_CONTRIBUTOR)
+    locked_at_dispatch = []
+    monkeypatch.setattr(
+        poller.gtfs_processor, "delay", lambda c: locked_at_dispatch.append(bool(redis_client.exists(lock_name)))
+    )
+    allow_reprocess_same_data(GTFS_CONTRIBUTOR)
+    redis_client.delete(build_redis_pending_feed_key(GTFS_CONTRIBUTOR))
+    with requests_mock.Mocker() as m:
+        m.get(feed_url, content=basic_gtfs_rt_data.SerializeToString())
+        poller.check_contributor(config)
+    assert locked_at_dispatch == [False]
+
+
+def test_gtfs_processor(basic_gtfs_rt_data, mock_rabbitmq):
+    """
+    the pending feed found by the concurrent poller is processed, then forgotten
+    if it expired, it's retrieved and processed again at next polling
+    """
+    config = {"contributor": GTFS_CONTRIBUTOR, "navitia_url": "", "token": "", "coverage": ""}
+    pending_feed_key = build_redis_pending_feed_key(GTFS_CONTRIBUTOR)
+    content = basic_gtfs_rt_data.SerializeToString()
+    allow_reprocess_same_data(GTFS_CONTRIBUTOR)
+    assert _is_new_feed(GTFS_CONTRIBUTOR, basic_gtfs_rt_data, content)  # as checked by the poller
+    redis_client.set(pending_feed_key, content)
+
+    gtfs_processor(config)
+    assert not redis_client.exists(pending_feed_key)
+    with app.app_context():
+        assert len(RealTimeUpdate.query.all()) == 1
+        assert RealTimeUpdate.query.first().raw_data == content
+        assert len(TripUpdate.query.all()) == 1
+
+    gtfs_processor(config)  # pending feed expired
+    assert _is_new_feed(GTFS_CONTRIBUTOR, basic_gtfs_rt_data, content)
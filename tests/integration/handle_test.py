@@ -238,6 +238,42 @@ def test_handle_new_vj():
         assert db_st_updates[1].trip_update_id == db_trip_updates[0].vj_id
 
 
+def test_handle_delay_change_keeps_stop_time_rows():
+    """
+    a new delay on one stop only updates the existing rows of stop_times: they are neither deleted nor created
+    """
+    navitia_vj = {
+        "trip": {"id": "vehicle_journey:1"},
+        "stop_times": [
+            {
+                "utc_arrival_time": None,
+                "utc_departure_time": datetime.time(8, 10),
+                "stop_point": {"id": "sa:1", "stop_area": {"timezone": "UTC"}},
+            },
+            {
+                "utc_arrival_time": datetime.time(9, 10),
+                "utc_departure_time": None,
+                "stop_point": {"id": "sa:2", "stop_area": {"timezone": "UTC"}},
+            },
+        ],
+    }
+    with app.app_context():
+        for delay in [5, 10]:
+            trip_update = TripUpdate(_create_db_vj(navitia_vj), contributor=COTS_CONTRIBUTOR, status="update")
+            st = StopTimeUpdate({"id": "sa:1"}, departure_delay=timedelta(minutes=delay), dep_status="update")
+            trip_update.stop_time_updates.append(st)
+            real_time_update = make_rt_update(raw_data=None, connector="cots", contributor=COTS_CONTRIBUTOR)
+            handle(real_time_update, [trip_update], contributor=COTS_CONTRIBUTOR)
+            if delay == 5:
+                stu_ids = sorted(stu.id for stu in StopTimeUpdate.query.all())
+
+        db_st_updates = StopTimeUpdate.query.order_by(StopTimeUpdate.order).all()
+        assert sorted(stu.id for stu in db_st_updates) == stu_ids
+        assert db_st_updates[0].departure == _dt("8:20")
+        assert db_st_updates[0].departure_delay == timedelta(minutes=10)
+        assert db_st_updates[1].arrival == _dt("9:10")
+
+
 def test_past_midnight():
     """
     integration of a past midnight
@@ -359,7 +395,7 @@ def test_manage_consistency(navitia_vj):
         assert len(res.trip_updates) == 1
         trip_update = res.trip_updates[0]
         assert trip_update.status == "update"
-        assert len(trip_update.real_time_updates) == 1
+        assert trip_update.real_time_updates.count() == 1
         assert len(trip_update.stop_time_updates) == 3
 
         stu_map = {stu.stop_id: stu for stu in trip_update.stop_time_updates}
@@ -405,7 +441,7 @@ def test_handle_update_vj(setup_database, navitia_vj):
         assert len(res.trip_updates) == 1
         trip_update = res.trip_updates[0]
         assert trip_update.status == "update"
-        assert len(trip_update.real_time_updates) == 2
+        assert trip_update.real_time_updates.count() == 2
         assert len(trip_update.stop_time_updates) == 3
 
         stu_map = {stu.stop_id: stu for stu in trip_update.stop_time_updates}
@@ -423,7 +459,7 @@ def test_handle_update_vj(setup_database, navitia_vj):
         assert stu_map["sa:3"].departure == _dt("10:05")
 
         # testing that RealTimeUpdate is persisted in db
-        db_trip_updates = TripUpdate.query.join(VehicleJourney).order_by("start_timestamp").all()
+        db_trip_updates = TripUpdate.query.join(TripUpdate.vj).order_by("start_timestamp").all()
         assert len(db_trip_updates) == 2
         assert real_time_update.query.from_self(TripUpdate).all()[0].status == "update"
         st_updates = real_time_update.query.from_self(StopTimeUpdate).order_by("stop_id").all()
@@ -526,7 +562,7 @@ def _check_multiples_delay(res):
     trip_update = res.trip_updates[0]
     assert trip_update.status == "update"
     assert len(trip_update.stop_time_updates) == 3
-    assert len(trip_update.real_time_updates) == 2
+    assert trip_update.real_time_updates.count() == 2
 
     stu = trip_update.stop_time_updates
     # Note: order is important
@@ -629,7 +665,7 @@ def test_delays_then_cancellation(setup_database, navitia_vj):
         trip_update = res.trip_updates[0]
         assert trip_update.status == "delete"
         assert len(trip_update.stop_time_updates) == 0
-        assert len(trip_update.real_time_updates) == 2
+        assert trip_update.real_time_updates.count() == 2
 
 
 def test_delays_then_cancellation_in_2_updates(navitia_vj):
@@ -652,7 +688,7 @@ def test_delays_then_cancellation_in_2_updates(navitia_vj):
         trip_update = res.trip_updates[0]
         assert trip_update.status == "delete"
         assert len(trip_update.stop_time_updates) == 0
-        assert len(trip_update.real_time_updates) == 2
+        assert trip_update.real_time_updates.count() == 2
 
 
 def _check_cancellation_then_delay(res):
@@ -660,7 +696,7 @@ def _check_cancellation_then_delay(res):
     trip_update = res.trip_updates[0]
     assert trip_update.status == "update"
     assert len(trip_update.stop_time_updates) == 3
-    assert len(trip_update.real_time_updates) == 2
+    assert trip_update.real_time_updates.count() == 2
 
     stu = trip_update.stop_time_updates
     # Note: order is important
@@ -31,7 +31,15 @@
 
 from __future__ import absolute_import, print_function, unicode_literals, division
 
-from kirin.core.model import VehicleJourney, TripUpdate, StopTimeUpdate, Contributor
+from kirin.core.model import (
+    VehicleJourney,
+    TripUpdate,
+    StopTimeUpdate,
+    Contributor,
+    RealTimeUpdate,
+    RawData,
+    find_daily_partitions,
+)
 from kirin.core.types import ConnectorType
 from kirin.utils import make_rt_update
 from tests.integration.conftest import COTS_CONTRIBUTOR, GTFS_CONTRIBUTOR
@@ -95,6 +103,131 @@ def test_find_by_vj(setup_database):
         assert row.vj_id == "70866ce8-0638-4fa1-8556-1ddfa22d09d4"
 
 
+def test_find_by_dated_vjs(setup_database):
+    with app.app_context():
+        assert TripUpdate.find_by_dated_vjs([]) == []
+        rows = TripUpdate.find_by_dated_vjs(
+            [
+                ("vehicle_journey:1", datetime.datetime(2015, 9, 8, 8, 0)),
+                ("vehicle_journey:1", datetime.datetime(2015, 9, 9, 8, 0)),
+                ("vehicle_journey:2", datetime.datetime(2015, 9, 9, 8, 0)),
+                ("vehicle_journey:2", datetime.datetime(2015, 9, 9, 8, 0)),
+            ]
+        )
+        assert sorted(r.vj_id for r in rows) == [
+            "70866ce8-0638-4fa1-8556-1ddfa22d09d3",
+            "70866ce8-0638-4fa1-8556-1ddfa22d09d5",
+        ]
+
+
+def test_remove_by_contributors_and_period_in_batches(setup_database):
+    with app.app_context():
+        nb_removed = TripUpdate.remove_by_contributors_and_period(
+            contributors=[COTS_CONTRIBUTOR], end_date=datetime.date(2015, 9, 8), batch_size=1
+        )
+        assert nb_removed == 2
+        assert [tu.vj_id for tu in TripUpdate.query.all()] == ["70866ce8-0638-4fa1-8556-1ddfa22d09d5"]
+        assert VehicleJourney.query.count() == 1
+
+        # nothing for other contributors
+        assert TripUpdate.remove_by_contributors_and_period(contributors=[GTFS_CONTRIBUTOR]) == 0
+        assert TripUpdate.query.count() == 1
+
+
+def test_remove_by_contributors_and_period_drops_partitions(setup_database):
+    with app.app_context():
+        create_trip_update(
+            "70866ce8-0638-4fa1-8556-1ddfa22d09d6",
+            "vehicle_journey:3",
+            datetime.date(2015, 9, 9),
+            contributor=GTFS_CONTRIBUTOR,
+        )
+        db.session.commit()
+        days = [day for day, _ in find_daily_partitions("vehicle_journey")]
+        assert datetime.date(2015, 9, 8) in days
+        assert datetime.date(2015, 9, 9) in days
+
+        # 2015-09-08 is dropped, 2015-09-09 is kept for the GTFS-RT trip
+        assert TripUpdate.remove_by_contributors_and_period(contributors=[COTS_CONTRIBUTOR]) == 3
+        days = [day for day, _ in find_daily_partitions("trip_update")]
+        assert datetime.date(2015, 9, 8) not in days
+        assert datetime.date(2015, 9, 9) in days
+        assert [tu.vj_id for tu in TripUpdate.query.all()] == ["70866ce8-0638-4fa1-8556-1ddfa22d09d6"]
+        assert TripUpdate.find_vj_by_period(
+            "vehicle_journey:3", datetime.datetime(2015, 9, 9), datetime.datetime(2015, 9, 10)
+        )
+
+
+def test_remove_rt_updates_by_dropping_partitions():
+    with app.app_context():
+        for day in [14, 15]:
+            rtu = RealTimeUpdate("", "gtfs-rt", GTFS_CONTRIBUTOR)
+            rtu.created_at = datetime.datetime(2012, 6, day, 10, 0)
+            db.session.add(rtu)
+        # the RealTimeUpdate of 2012-06-15 is still used by a TripUpdate
+        rtu.trip_updates.append(
+            create_trip_update("70866ce8-0638-4fa1-8556-1ddfa22d09d3", "vj1", datetime.date(2012, 6, 15))
+        )
+        db.session.commit()
+        partitions = RealTimeUpdate.find_partitions()
+        assert (datetime.date(2012, 6, 14), "real_time_update_20120614") in partitions
+        assert (datetime.date(2012, 6, 15), "real_time_update_20120615") in partitions
+
+        # nothing dropped for another connector
+        assert RealTimeUpdate.drop_partitions_by_connectors_until(["cots"], datetime.date(2012, 6, 20)) == 0
+
+        RealTimeUpdate.remove_by_connectors_until(["gtfs-rt"], datetime.date(2012, 6, 20))
+        partitions = [name for _, name in RealTimeUpdate.find_partitions()]
+        assert "real_time_update_20120614" not in partitions
+        assert "real_time_update_20120615" in partitions
+        assert [r.id for r in RealTimeUpdate.query.all()] == [rtu.id]
+
+
+def test_stop_time_updates_stored_in_partition_of_their_vj():
+    with app.app_context():
+        vj_start = datetime.datetime(2015, 9, 10, 8, 0)
+        trip_update = create_trip_update("70866ce8-0638-4fa1-8556-1ddfa22d09d7", "vj1", vj_start.date())
+        # found around its time, next day, without time, and far from it (looked up in every partition)
+        for departure in [vj_start, vj_start + datetime.timedelta(days=1), None, datetime.datetime(2015, 1, 1)]:
+            trip_update.stop_time_updates.append(StopTimeUpdate({"id": "sa:1"}, departure=departure))
+        db.session.commit()
+
+        nb_rows = db.session.execute("SELECT count(*) FROM ONLY stop_time_update_20150910").scalar()
+        assert nb_rows == 4
+
+
+def test_raw_data_shared_between_rt_updates():
+    with app.app_context():
+        for _ in range(2):
+            make_rt_update('{"cots": "été"}', "cots", contributor=COTS_CONTRIBUTOR)
+        make_rt_update(b"toto", "gtfs-rt", contributor=GTFS_CONTRIBUTOR)
+        db.session.expunge_all()
+
+        assert RawData.query.count() == 2
+        rtus = RealTimeUpdate.query.order_by(RealTimeUpdate.created_at).all()
+        assert rtus[0].raw_data_hash == rtus[1].raw_data_hash
+        assert rtus[0].raw_data == '{"cots": "été"}'.encode("utf-8")
+        assert rtus[2].raw_data == b"toto"
+        assert rtus[2].has_raw_data("toto")
+        assert not rtus[2].has_raw_data(b"titi")
+
+
+def test_raw_data_reuse_delays_purge():
+    with app.app_context():
+        make_rt_update(b"toto", "gtfs-rt", contributor=GTFS_CONTRIBUTOR)
+        first_use = db.session.query(RawData.created_at).scalar()
+        make_rt_update(b"toto", "gtfs-rt", contributor=GTFS_CONTRIBUTOR)
+        last_use = db.session.query(RawData.created_at).scalar()
+        assert last_use > first_use
+
+        RealTimeUpdate.query.delete()
+        db.session.commit()
+        RawData.remove_unused_until(first_use)
+        assert RawData.query.count() == 1
+        RawData.remove_unused_until(last_use)
+        assert RawData.query.count() == 0
+
+
 def test_find_stop():
     with app.app_context():
         vj = create_trip_update("70866ce8-0638-4fa1-8556-1ddfa22d09d3", "vj1", datetime.date(2015, 9, 8))
@@ -112,6 +245,72 @@ def test_find_stop():
         assert vj.find_stop("sa:4") is None
 
 
+def test_stop_index_same_as_find_stop():
+    with app.app_context():
+        vj = create_trip_update("70866ce8-0638-4fa1-8556-1ddfa22d09d3", "vj1", datetime.date(2015, 9, 8))
+        # lollipop: sa:1 is served twice
+        for stop_id in ["sa:1", "sa:2", "sa:1"]:
+            vj.stop_time_updates.append(StopTimeUpdate({"id": stop_id}, None, None))
+
+        index = vj.make_stop_index()
+        for stop_id in ["sa:1", "sa:2", "sa:3"]:
+            for order in [None, 0, 1, 2, 3]:
+                assert index.find_stop(stop_id, order) is vj.find_stop(stop_id, order)
+        assert index.find_stop("sa:1", 2) is vj.stop_time_updates[2]
+        assert index.find_stop("sa:1", 1) is vj.stop_time_updates[0]
+
+
+def test_compact_stop_time_updates(monkeypatch):
+    with app.app_context():
+        monkeypatch.setitem(app.config, str("USE_COMPACT_STOP_TIME_UPDATES"), True)
+        tu = create_trip_update("70866ce8-0638-4fa1-8556-1ddfa22d09d3", "vj1", datetime.date(2015, 9, 8))
+        tu.stop_time_updates.append(
+            StopTimeUpdate(
+                {"id": "sa:1"},
+                departure=datetime.datetime(2015, 9, 8, 8, 5),
+                departure_delay=datetime.timedelta(minutes=5),
+                dep_status="update",
+            )
+        )
+        tu.stop_time_updates.append(StopTimeUpdate({"id": "sa:2"}, arrival=datetime.datetime(2015, 9, 8, 9, 0)))
+        db.session.commit()
+
+        # no row is used for stop_times
+        assert StopTimeUpdate.query.count() == 0
+        db.session.expunge_all()
+
+        tu = TripUpdate.query.get("70866ce8-0638-4fa1-8556-1ddfa22d09d3")
+        assert len(tu.compact_stop_time_updates) == 2
+        assert [(st.stop_id, st.order) for st in tu.stop_time_updates] == [("sa:1", 0), ("sa:2", 1)]
+        assert tu.stop_time_updates[0].departure == datetime.datetime(2015, 9, 8, 8, 5)
+        assert tu.stop_time_updates[0].departure_delay == datetime.timedelta(minutes=5)
+        assert tu.stop_time_updates[0].departure_status == "update"
+        assert tu.stop_time_updates[1].arrival == datetime.datetime(2015, 9, 8, 9, 0)
+        assert tu.stop_time_updates[1].arrival_delay is None
+        # stop_times only read are not saved again
+        assert tu not in db.session.dirty
+
+        # modification of a stop_time is saved
+        tu.stop_time_updates[1].update_arrival(delay=datetime.timedelta(minutes=2), status="update")
+        db.session.commit()
+        db.session.expunge_all()
+        tu = TripUpdate.query.get("70866ce8-0638-4fa1-8556-1ddfa22d09d3")
+        assert tu.stop_time_updates[1].arrival_delay == datetime.timedelta(minutes=2)
+        assert tu.stop_time_updates[1].arrival_status == "update"
+
+        # stop_times are read again from the db on refresh
+        db.session.execute(
+            "UPDATE trip_update"
+            "    SET compact_stop_time_updates = CAST(json_build_array(compact_stop_time_updates -> 0) AS JSONB)"
+            "    WHERE vj_id = :id",
+            {"id": tu.vj_id},
+        )
+        db.session.refresh(tu)
+        assert [st.stop_id for st in tu.stop_time_updates] == ["sa:1"]
+        db.session.rollback()
+        assert len(tu.stop_time_updates) == 2
+
+
 def test_find_activate():
     with app.app_context():
         create_real_time_update(
@@ -30,7 +30,9 @@
 # www.navitia.io
 
 from __future__ import absolute_import, print_function, unicode_literals, division
-from kirin.utils import str_to_date
+from kirin import app
+from kirin.utils import str_to_date, call_concurrently
+from kirin.http_sessions import get_session
 import datetime
 
 
@@ -42,3 +44,27 @@ def test_valid_date():
 def test_invalid_date():
     res = str_to_date("aaaa")
     assert res == None
+
+
+def test_call_concurrently():
+    def square(x):
+        if x < 0:
+            raise ValueError("negative")
+        return x * x
+
+    default_pool_size = app.config[str("NAVITIA_QUERY_POOL_SIZE")]
+    try:
+        with app.app_context():
+            for pool_size in [1, 4]:
+                app.config[str("NAVITIA_QUERY_POOL_SIZE")] = pool_size
+                res = call_concurrently(square, [(1,), (2,), (-3,), (2,)])
+                assert res == {(1,): 1, (2,): 4}  # failed call is left out
+    finally:
+        app.config[str("NAVITIA_QUERY_POOL_SIZE")] = default_pool_size
+
+
+def test_get_session():
+    session = get_session("http://feed.provider.com/gtfs_rt?id=1")
+    assert get_session("http://feed.provider.com/gtfs_rt?id=2") is session
+    assert get_session("https://feed.provider.com/gtfs_rt") is not session
+    assert get_session("http://navitia.io/v1") is not session
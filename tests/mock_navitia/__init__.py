@@ -43,6 +43,7 @@ from tests.mock_navitia import (
     vj_840426,
     vj_R_vj1,
     vj_R_vj2,
+    vj_R_vj1_vj2,
     vj_pass_midnight,
     vj_pass_midnight_utc,
     vj_lollipop,
@@ -51,16 +52,13 @@ from tests.mock_navitia import (
     vj_start_midnight_utc,
     st_713065,
     st_713666,
-    company_1187,
-    empty_company_1180,
-    company_OCETH,
+    companies,
+    physical_modes,
     st_0087_318964_BV,
     st_0087_319012_00,
     st_0087_683573_BV,
     st_0087_686667_BV,
     st_0087_751008_BV,
-    physical_mode_LongDistanceTrain,
-    physical_mode_Coach,
     st_0087_543009_BV,
     st_0087_215632_00,
     vj_9580,
@@ -82,6 +80,7 @@ mocks = [
     vj_840426.response,
     vj_R_vj1.response,
     vj_R_vj2.response,
+    vj_R_vj1_vj2.response,
     vj_pass_midnight.response,
     vj_pass_midnight_utc.response,
     vj_lollipop.response,
@@ -90,18 +89,15 @@ mocks = [
     vj_start_midnight_utc.response,
     st_713065.response,
     st_713666.response,
-    company_1187.response,
-    empty_company_1180.response,
-    company_OCETH.response,
+    companies.response,
+    physical_modes.response,
     st_0087_751008_BV.response,
     st_0087_686667_BV.response,
     st_0087_683573_BV.response,
     st_0087_319012_00.response,
     st_0087_318964_BV.response,
-    physical_mode_LongDistanceTrain.response,
     st_0087_543009_BV.response,
     st_0087_215632_00.response,
-    physical_mode_Coach.response,
     vj_unknown_object.response,
     vj_9580.response,
     st_0087_191981_WL.response,
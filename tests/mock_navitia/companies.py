@@ -34,13 +34,31 @@ from tests.mock_navitia import navitia_response
 
 response = navitia_response.NavitiaResponse()
 
-response.queries = ['companies/?filter=company.has_code("RefProd", "OCETH")&count=1']
+response.queries = ["companies/?count=1000"]
 
 response.response_code = 200
 
 response.json_response = """
 {
 "companies": [
+    {
+        "codes": [
+            {
+                "type": "RefProd",
+                "value": "1187"
+            },
+            {
+                "type": "external_code",
+                "value": "OCESN"
+            },
+            {
+                "type": "source",
+                "value": "SN"
+            }
+        ],
+        "id": "company:OCE:SN",
+        "name": "SNCF CRS"
+    },
     {
         "codes": [
             {
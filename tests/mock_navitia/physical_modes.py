@@ -34,7 +34,7 @@ from tests.mock_navitia import navitia_response
 
 response = navitia_response.NavitiaResponse()
 
-response.queries = ["physical_modes/?filter=physical_mode.id=physical_mode:LongDistanceTrain&count=1"]
+response.queries = ["physical_modes/?count=1000"]
 
 response.response_code = 200
 
@@ -44,6 +44,10 @@ response.json_response = """
     {
       "name": "Train grande vitesse",
       "id": "physical_mode:LongDistanceTrain"
+    },
+    {
+      "name": "Coach",
+      "id": "physical_mode:Coach"
     }
   ]
 }